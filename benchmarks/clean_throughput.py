@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import clean as clean
+
+# Cleaning speed of clean.clean_vote_frame on a synthetic raw csv, against two row wise apply versions
+#   python benchmarks/clean_throughput.py [--rows 1000000] [--seed 0]
+# pre-vectorization: the cleaner just before vectorizing, same rules as now, its output must be identical
+#                    to clean_vote_frame's or the run fails, the reported speedup is against this one
+# baseline:          the original clean_vote_data, before leading '10' votes were read as 10,
+#                    so its output differs and it is only timed
+
+misreads = ["PARAiso", "PARAISO", "KINGS ROW", "K1NG'S ROW", "ESPERANCA", "CIRCUIT ROYAI", "NEW JUNK C1TY", "LIJIANG T0WER"]
+vote_texts = ["VOTE", "0 VOTES", "1 VOTE", "2 VOTES", "3 VOTES", "4 VOTES", "5 VOTES", "6 VOTES", "7 VOTES", "8 VOTES",
+              "9 VOTES", "10 VOTES", "S VOTES", "VOTES", ""]
+
+def synthetic_raw(rows, seed):
+    rng = np.random.default_rng(seed)
+    names = np.array(clean.overwatch_maps + misreads, dtype=object)
+    map_weights = np.r_[np.full(len(clean.overwatch_maps), 0.9 / len(clean.overwatch_maps)), np.full(len(misreads), 0.1 / len(misreads))]
+    vote_weights = np.r_[0.05, np.full(11, 0.85 / 11), np.full(3, 0.1 / 3)]
+    days = pd.date_range('2025-06-24', periods=60, freq='D').strftime('%Y-%m-%dT%H:%M:%SZ').to_numpy()
+    df = pd.DataFrame({
+        'user_name': rng.choice(['August', 'Flats', 'Kephrii', 'Emongg'], rows),
+        'url': 'https://www.twitch.tv/videos/' + pd.Series(rng.integers(2_000_000_000, 2_000_100_000, rows)).astype(str),
+        'created_at': rng.choice(days, rows),
+    })
+    for i in (1, 2, 3):
+        df[f'map{i}'] = rng.choice(names, rows, p=map_weights)
+        df[f'votes{i}'] = rng.choice(np.array(vote_texts, dtype=object), rows, p=vote_weights)
+    return df[clean.raw_column_names]
+
+# The original clean.clean_vote_data without its file reading and writing, reads '10 VOTES' as 1
+def baseline_clean_vote_frame(df):
+    for col in ['votes1', 'votes2', 'votes3']:
+        df[col] = df[col].apply(lambda x: '1' + str(x) if str(x) == 'VOTE' else x)
+    for col in ['votes1', 'votes2', 'votes3']:
+        df[col] = df[col].apply(lambda x: x[0] if str(x)[0].isdigit() else None)
+    df = df.dropna(subset=['votes1', 'votes2', 'votes3'])
+    for col in ['map1', 'map2', 'map3']:
+        df[col] = df[col].str.upper()
+    for col in ['map1', 'map2', 'map3']:
+        df[col] = df[col].apply(lambda x: clean.fix_map_name(x, clean.overwatch_maps))
+    df = df.dropna(subset=['map1', 'map2', 'map3'])
+    df['created_at'] = pd.to_datetime(df['created_at'])
+    df['created_at'] = df['created_at'].dt.date
+    df = df.drop_duplicates(subset=['map1', 'votes1', 'map2', 'votes2', 'map3', 'votes3', 'created_at'], keep='first')
+    df['total_votes'] = df[['votes1', 'votes2', 'votes3']].apply(lambda x: sum(int(v) for v in x if str(v).isdigit()), axis=1)
+    df = df[df['total_votes'] > 1]
+    df = df[df['total_votes'] <= 10]
+    df['percent1'] = df['votes1'].astype(int) / df['total_votes']
+    df['percent2'] = df['votes2'].astype(int) / df['total_votes']
+    df['percent3'] = df['votes3'].astype(int) / df['total_votes']
+    df['winner'] = df.apply(lambda row: row['map1'] if row['votes1'] > row['votes2'] and row['votes1'] > row['votes3']
+                            else (row['map2'] if row['votes2'] > row['votes1'] and row['votes2'] > row['votes3']
+                                else (row['map3'] if row['votes3'] > row['votes1'] and row['votes3'] > row['votes2']
+                                        else 'draw')), axis=1)
+    return df
+
+# clean.clean_vote_frame as it was just before vectorizing and memoizing the fuzzy map matching
+# Already reads a leading '10' as 10 votes, like the current cleaner, so the two outputs compare row for row
+def prevectorized_clean_vote_frame(df):
+    for col in ['votes1', 'votes2', 'votes3']:
+        df[col] = df[col].apply(lambda x: '1' + str(x) if str(x) == 'VOTE' else x)
+    for col in ['votes1', 'votes2', 'votes3']:
+        df[col] = df[col].apply(lambda x: '10' if str(x).startswith('10') else x[0] if str(x)[0].isdigit() else None)
+    df = df.dropna(subset=['votes1', 'votes2', 'votes3'])
+    for col in ['votes1', 'votes2', 'votes3']:
+        df[col] = df[col].astype(int)
+    for col in ['map1', 'map2', 'map3']:
+        df[col] = df[col].str.upper()
+    for col in ['map1', 'map2', 'map3']:
+        df[col] = df[col].apply(lambda x: clean.fix_map_name(x, clean.overwatch_maps))
+    df = df.dropna(subset=['map1', 'map2', 'map3'])
+    df['created_at'] = pd.to_datetime(df['created_at'])
+    df['created_at'] = df['created_at'].dt.date
+    df = df.drop_duplicates(subset=clean.dedupe_columns, keep='first')
+    df['total_votes'] = df[['votes1', 'votes2', 'votes3']].apply(lambda x: sum(int(v) for v in x if str(v).isdigit()), axis=1)
+    df = df[df['total_votes'] > 1]
+    df = df[df['total_votes'] <= 10]
+    df['percent1'] = df['votes1'].astype(int) / df['total_votes']
+    df['percent2'] = df['votes2'].astype(int) / df['total_votes']
+    df['percent3'] = df['votes3'].astype(int) / df['total_votes']
+    df['winner'] = df.apply(lambda row: row['map1'] if row['votes1'] > row['votes2'] and row['votes1'] > row['votes3']
+                            else (row['map2'] if row['votes2'] > row['votes1'] and row['votes2'] > row['votes3']
+                                else (row['map3'] if row['votes3'] > row['votes1'] and row['votes3'] > row['votes2']
+                                        else 'draw')), axis=1)
+    return df
+
+def timed(name, fn, raw_csv):
+    df = pd.read_csv(raw_csv, names=clean.raw_column_names, header=None)
+    start = time.perf_counter()
+    out = fn(df)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>17}: {len(out)} cleaned rows in {elapsed:.2f}s")
+    return out, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="clean_vote_frame throughput")
+    parser.add_argument('--rows', type=int, default=1_000_000, help="Synthetic raw rows")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_csv = os.path.join(tmp, 'raw.csv')
+        # Start from an empty alias table, so the run includes learning it
+        clean.map_aliases_path = os.path.join(tmp, 'map_aliases.csv')
+        synthetic_raw(args.rows, args.seed).to_csv(raw_csv, header=False, index=False)
+
+        _, baseline_time = timed('baseline', baseline_clean_vote_frame, raw_csv)
+        before, before_time = timed('pre-vectorization', prevectorized_clean_vote_frame, raw_csv)
+        current, current_time = timed('vectorized', clean.clean_vote_frame, raw_csv)
+        timed('cached', clean.clean_vote_frame, raw_csv)
+
+    pd.testing.assert_frame_equal(before.reset_index(drop=True), current.reset_index(drop=True))
+    print(f"Identical output to the pre-vectorization cleaner, {before_time / current_time:.1f}x faster "
+          f"({baseline_time / current_time:.1f}x faster than the baseline cleaner, whose output differs)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import gc
+import time
+import argparse
+import subprocess
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import ffmpeg_helper as ffmpeg_helper
+
+# Frames/sec through the FFmpeg pipe, before and after the FrameSource rewrite
+#   python benchmarks/frame_throughput.py video.mp4 [--frames 3000] [--fps 10] [--crop]
+# before:   the old loop, read() of a new bytes object per frame, frombuffer, 10ms sleep and gc.collect() per frame
+# read:     the old read without the sleep and gc, to separate the two costs
+# readinto: ffmpeg_helper.DecodeSession, frames read into one preallocated buffer
+
+# Same filter graph as DecodeSession, so every mode measures the shipped decode
+def ffmpeg_cmd(video, fps, crop):
+    filters, _ = ffmpeg_helper.decode_filters(fps, crop)
+    return ['ffmpeg', '-i', video, '-vf', ', '.join(filters), '-f', 'rawvideo', '-pix_fmt', 'gray', '-loglevel', 'error', 'pipe:1']
+
+def run_read(video, fps, crop, max_frames, throttle):
+    _, shape = ffmpeg_helper.decode_filters(fps, crop)
+    frame_size = shape[0] * shape[1]
+    proc = subprocess.Popen(ffmpeg_cmd(video, fps, crop), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    frames = 0
+    checksum = 0
+    while frames < max_frames:
+        if throttle:
+            time.sleep(0.01)
+        raw_frame = proc.stdout.read(frame_size)
+        if len(raw_frame) < frame_size:
+            break
+        frame = np.frombuffer(raw_frame, np.uint8).reshape(shape)
+        checksum += int(frame[0, 0])
+        frames += 1
+        if throttle:
+            del frame
+            gc.collect()
+    proc.stdout.close()
+    proc.terminate()
+    proc.wait()
+    return frames, checksum
+
+def run_readinto(video, fps, crop, max_frames):
+    frames = 0
+    checksum = 0
+    with ffmpeg_helper.DecodeSession(video, fps, crop_vote_area=crop) as session:
+        while frames < max_frames:
+            _, frame = session.read()
+            if frame is None:
+                break
+            checksum += int(frame[0, 0])
+            frames += 1
+    return frames, checksum
+
+def main():
+    parser = argparse.ArgumentParser(description="FFmpeg pipe read throughput")
+    parser.add_argument('video', help="Local video file or m3u8 url")
+    parser.add_argument('--frames', type=int, default=3000, help="Frames to read per mode")
+    parser.add_argument('--fps', type=float, default=10, help="Output frame rate of the FFmpeg pipe")
+    parser.add_argument('--crop', action='store_true', help="Pipe only the vote banner, as with --crop-at-decode")
+    parser.add_argument('--modes', default='before,read,readinto', help="Comma separated modes to run")
+    args = parser.parse_args()
+
+    for mode in args.modes.split(','):
+        start = time.perf_counter()
+        if mode == 'readinto':
+            frames, checksum = run_readinto(args.video, args.fps, args.crop, args.frames)
+        else:
+            frames, checksum = run_read(args.video, args.fps, args.crop, args.frames, throttle=mode == 'before')
+        elapsed = time.perf_counter() - start
+        print(f"{mode:>9}: {frames} frames in {elapsed:.2f}s, {frames / elapsed:.1f} frames/sec (checksum {checksum})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import os
+import sys
+import csv
+import time
+import asyncio
+import tempfile
+import traceback
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import mock_helix as mock_helix
+
+# Runs twitch_helper's Helix client against benchmarks/mock_helix.py and checks each of its paths:
+# pagination stop, concurrency cap, 429 with Ratelimit-Reset, rate limit headers, 401 token refresh, 5xx retries,
+# and the synchronous helpers app.py calls
+#   python benchmarks/helix_check.py
+# Prints one line per check, exits with status 1 if any failed
+# The 5xx backoff and rate limit waits are real, a full run takes about 10 seconds
+
+mock = mock_helix.MockHelix(latency=0.02).start()
+os.environ.update(mock.environment())
+import requests
+import twitch_helper as twitch_helper
+
+def new_client(**kwargs):
+    provider = twitch_helper.TokenProvider()
+    return twitch_helper.HelixClient(provider, **kwargs)
+
+def run(fn, **kwargs):
+    client = new_client(**kwargs)
+    try:
+        return asyncio.run(fn(client))
+    finally:
+        client.close()
+
+def user_id(login):
+    return run(lambda client: client.user_id(login))
+
+# A user's VODs in a 30 day window are 121 VODs (one every 6 hours), the second page of 100 reaches past the start
+# so the third is never requested
+def check_pagination_stop():
+    uid = user_id('pagination_user')
+    end = mock_helix.newest_vod
+    start = end - timedelta(days=30)
+    mock.reset_counters()
+    vods = run(lambda client: client.user_vods(uid, start, end))
+    pages = [q for path, q in mock.requests if path == '/helix/videos']
+    assert len(vods) == 121, f"{len(vods)} VODs"
+    assert len(pages) == 2, f"{len(pages)} pages requested"
+    assert pages[1].get('after') == '100', f"second page cursor {pages[1].get('after')}"
+    return f"{len(vods)} VODs from {len(pages)} pages"
+
+# Many users at once never put more than max_concurrency requests in flight
+def check_concurrency():
+    ids = [user_id(f'concurrent_user{i}') for i in range(12)]
+    end = mock_helix.newest_vod
+    start = end - timedelta(days=5)
+    mock.reset_counters()
+    mock.latency = 0.1
+    try:
+        per_user = run(lambda client: client.whitelist_vods(ids, start, end), max_concurrency=4)
+    finally:
+        mock.latency = 0.02
+    assert all(len(vods) == 21 for vods in per_user), [len(vods) for vods in per_user]
+    assert 1 < mock.max_in_flight <= 4, f"{mock.max_in_flight} in flight"
+    return f"{len(ids)} users, at most {mock.max_in_flight} requests in flight"
+
+# A 429 is retried once its Ratelimit-Reset has passed, not before
+def check_429_reset():
+    uid = user_id('limited_user')
+    mock.reset_counters()
+    mock.inject(429, reset_in=1.5)
+    start = time.perf_counter()
+    j = run(lambda client: client.get('videos', {'user_id': uid, 'first': 1}))
+    elapsed = time.perf_counter() - start
+    assert mock.statuses == [429, 200], mock.statuses
+    assert len(j['data']) == 1
+    assert elapsed >= 1.4, f"retried after {elapsed:.2f}s"
+    return f"retried after {elapsed:.2f}s"
+
+# Ratelimit-Remaining 0 holds the next request back until Ratelimit-Reset, so the bucket never runs into a 429
+def check_rate_limit_headers():
+    uid = user_id('paced_user')
+    async def two_requests(client):
+        await client.get('videos', {'user_id': uid, 'first': 1})
+        mock.drain(reset_in=1.5)
+        await client.get('videos', {'user_id': uid, 'first': 1})
+        sent = time.perf_counter()
+        await client.get('videos', {'user_id': uid, 'first': 1})
+        return time.perf_counter() - sent
+    mock.reset_counters()
+    elapsed = run(two_requests)
+    assert mock.statuses == [200, 200, 200], mock.statuses
+    assert elapsed >= 1.3, f"third request after {elapsed:.2f}s"
+    return f"held back {elapsed:.2f}s, no 429"
+
+# A revoked token is dropped and fetched again once, a second 401 in a row is raised
+def check_401_refresh():
+    uid = user_id('token_user')
+    async def revoked(client):
+        await client.get('videos', {'user_id': uid, 'first': 1})
+        mock.revoke_tokens()
+        return await client.get('videos', {'user_id': uid, 'first': 1})
+    mock.reset_counters()
+    run(revoked)
+    assert mock.statuses == [200, 401, 200], mock.statuses
+    assert mock.token_requests == 2, f"{mock.token_requests} token requests"
+    mock.reset_counters()
+    mock.inject(401, times=2)
+    try:
+        run(lambda client: client.get('videos', {'user_id': uid, 'first': 1}))
+    except requests.HTTPError as e:
+        assert e.response.status_code == 401
+    else:
+        raise AssertionError("second 401 not raised")
+    assert mock.statuses == [401, 401], mock.statuses
+    return "refreshed once, then raised"
+
+# 5xx responses are retried with backoff up to max_retries, then raised
+def check_5xx_retries():
+    uid = user_id('flaky_user')
+    mock.reset_counters()
+    mock.inject(503, times=2)
+    start = time.perf_counter()
+    run(lambda client: client.get('videos', {'user_id': uid, 'first': 1}), max_retries=2)
+    elapsed = time.perf_counter() - start
+    assert mock.statuses == [503, 503, 200], mock.statuses
+    assert elapsed >= 2.9, f"backoff {elapsed:.2f}s"
+    mock.reset_counters()
+    mock.inject(500, times=2)
+    try:
+        run(lambda client: client.get('videos', {'user_id': uid, 'first': 1}), max_retries=1)
+    except requests.HTTPError as e:
+        assert e.response.status_code == 500
+    else:
+        raise AssertionError("500 after max_retries not raised")
+    assert mock.statuses == [500, 500], mock.statuses
+    return f"recovered after 2 failures in {elapsed:.2f}s, raised after max_retries"
+
+# get_whitelist_overwatch_vods and get_random_overwatch_vods, as app.py calls them, through the environment only
+def check_sync_helpers():
+    end = mock_helix.newest_vod
+    start = end - timedelta(days=2)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'whitelist.csv')
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['username', 'user_id'])
+            writer.writeheader()
+            for name in ['August', 'Danteh']:
+                writer.writerow({'username': name, 'user_id': twitch_helper.get_user_id(name)})
+        vods = twitch_helper.get_whitelist_overwatch_vods(path, start, end)
+    assert len(vods) == 18, f"{len(vods)} whitelist VODs"
+    assert {v[0] for v in vods} == {'August', 'Danteh'}
+    assert all(v[3] == 3 * 3600 + 2 * 60 + 1 for v in vods), "durations not parsed"
+    random_vods = twitch_helper.get_random_overwatch_vods()
+    assert len(random_vods) >= 50, f"{len(random_vods)} random VODs"
+    assert all(v['language'] == 'en' and twitch_helper.parse_duration(v['duration']) >= 3600 for v in random_vods)
+    return f"{len(vods)} whitelist VODs, {len(random_vods)} random VODs"
+
+checks = [check_pagination_stop, check_concurrency, check_429_reset, check_rate_limit_headers,
+          check_401_refresh, check_5xx_retries, check_sync_helpers]
+
+def main():
+    failed = 0
+    try:
+        for check in checks:
+            name = check.__name__.removeprefix('check_')
+            try:
+                print(f"ok      {name}: {check()}")
+            except Exception:
+                failed += 1
+                print(f"FAILED  {name}:\n{traceback.format_exc()}")
+    finally:
+        mock.stop()
+    print(f"{len(checks) - failed} of {len(checks)} checks passed")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+# Local stand-in for the Twitch Helix API and its OAuth token endpoint, for running twitch_helper without Twitch
+#   python benchmarks/mock_helix.py [--port 8765] [--points 800] [--vods 250]
+# then run twitch_helper or app.py with the environment variables it prints
+# Serves /helix/users, /helix/videos (by user_id or game_id, paginated with cursors) and POST /oauth2/token
+# Ratelimit-Limit, Ratelimit-Remaining and Ratelimit-Reset are sent like Helix, with a 429 once the bucket is empty,
+# the reset time has a fractional part so checks wait no longer than needed
+# Faults for the client's error paths (429, 5xx, revoked tokens) are queued with inject() and revoke_tokens(),
+# benchmarks/helix_check.py drives them
+
+client_id = 'mock-client-id'
+client_secret = 'mock-secret'
+newest_vod = datetime(2025, 7, 22, tzinfo=timezone.utc)
+
+# Archive VODs of a user, one every 6 hours back from newest_vod, newest first like Helix
+def user_videos(user_id, user_name, count):
+    return [{
+        'id': f'{user_id}{i:05d}',
+        'user_id': user_id,
+        'user_name': user_name,
+        'url': f'https://www.twitch.tv/videos/{user_id}{i:05d}',
+        'created_at': (newest_vod - timedelta(hours=6 * i)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'duration': '3h2m1s',
+        'language': 'en',
+        'type': 'archive',
+    } for i in range(count)]
+
+# Overwatch category archives, every third under an hour and every fifth not in english, so filters have work to do
+def game_videos(count):
+    videos = user_videos('9', 'random_streamer', count)
+    for i, v in enumerate(videos):
+        if i % 3 == 0:
+            v['duration'] = '45m10s'
+        if i % 5 == 0:
+            v['language'] = 'de'
+    return videos
+
+class MockHelix:
+    def __init__(self, port=0, points_per_minute=800, vods_per_user=250, token_expires_in=3600, latency=0.02):
+        self.points_per_minute = points_per_minute
+        self.vods_per_user = vods_per_user
+        self.token_expires_in = token_expires_in
+        self.latency = latency
+        self.users = {} # login: id, any login is known, ids are given out in order of first lookup
+        self.videos = {}
+        self.remaining = points_per_minute
+        self.reset_at = time.time() + 60
+        self.faults = deque() # (status, headers) answered to the next requests instead of their data
+        self.valid_tokens = set()
+        self.token_requests = 0
+        self.requests = [] # (path, query) of every Helix request that reached the data, after auth and faults
+        self.statuses = [] # status of every Helix response, in order
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.respond(*mock.handle_get(self.path, self.headers))
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+                self.respond(*mock.handle_post(self.path))
+
+            def respond(self, status, body, headers):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    @property
+    def helix_url(self):
+        return f'{self.base_url}/helix'
+
+    @property
+    def token_url(self):
+        return f'{self.base_url}/oauth2/token'
+
+    # Environment that points twitch_helper at this server
+    def environment(self):
+        return {'TWITCH_HELIX_URL': self.helix_url, 'TWITCH_OAUTH_URL': self.token_url,
+                'TWITCH_CLIENT_ID': client_id, 'TWITCH_SECRET': client_secret}
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    # Answers the next times Helix requests with status, a 429 empties the bucket until reset_in seconds from now
+    def inject(self, status, times=1, reset_in=1.0):
+        with self.lock:
+            for _ in range(times):
+                headers = {'Ratelimit-Reset': f'{time.time() + reset_in:.3f}', 'Ratelimit-Remaining': '0'} if status == 429 else {}
+                self.faults.append((status, headers))
+
+    # Leaves one point in the rate limit bucket until reset_in seconds from now, the next request is served with
+    # Ratelimit-Remaining 0, and any request after it before the reset gets a 429
+    def drain(self, reset_in=1.0):
+        with self.lock:
+            self.remaining = 1
+            self.reset_at = time.time() + reset_in
+
+    # Every token given out so far is rejected with a 401 from now on, like a revoked or early expired token
+    def revoke_tokens(self):
+        with self.lock:
+            self.valid_tokens.clear()
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = []
+            self.statuses = []
+            self.token_requests = 0
+            self.max_in_flight = 0
+
+    def handle_post(self, path):
+        url = urlsplit(path)
+        query = parse_qs(url.query)
+        if url.path != '/oauth2/token':
+            return 404, {'message': 'not found'}, {}
+        if query.get('client_id') != [client_id] or query.get('client_secret') != [client_secret]:
+            return 403, {'message': 'invalid client'}, {}
+        with self.lock:
+            self.token_requests += 1
+            token = f'mock-token-{self.token_requests}'
+            self.valid_tokens.add(token)
+        return 200, {'access_token': token, 'expires_in': self.token_expires_in, 'token_type': 'bearer'}, {}
+
+    # Takes a point from the bucket, refilled in full every minute like Helix's
+    # Returns the rate limit headers, and whether the request is over the limit
+    def _take_point(self):
+        now = time.time()
+        if now >= self.reset_at:
+            self.remaining = self.points_per_minute
+            self.reset_at = now + 60
+        limited = self.remaining <= 0
+        if not limited:
+            self.remaining -= 1
+        headers = {'Ratelimit-Limit': str(self.points_per_minute), 'Ratelimit-Remaining': str(self.remaining),
+                   'Ratelimit-Reset': f'{self.reset_at:.3f}'}
+        return headers, limited
+
+    def handle_get(self, path, headers):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            status, body, response_headers = self._get(path, headers)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+        with self.lock:
+            self.statuses.append(status)
+        return status, body, response_headers
+
+    def _get(self, path, headers):
+        url = urlsplit(path)
+        query = parse_qs(url.query)
+        token = (headers.get('Authorization') or '').removeprefix('Bearer ')
+        with self.lock:
+            if headers.get('Client-ID') != client_id or token not in self.valid_tokens:
+                return 401, {'error': 'Unauthorized', 'status': 401, 'message': 'Invalid OAuth token'}, {}
+            rate_headers, limited = self._take_point()
+            if self.faults:
+                status, fault_headers = self.faults.popleft()
+                if status == 429:
+                    self.remaining = 0
+                    self.reset_at = float(fault_headers['Ratelimit-Reset'])
+                return status, {'error': 'injected', 'status': status}, {**rate_headers, **fault_headers}
+            if limited:
+                return 429, {'error': 'Too Many Requests', 'status': 429}, rate_headers
+            self.requests.append((url.path, {k: v[0] for k, v in query.items()}))
+
+        if url.path == '/helix/users':
+            login = query.get('login', [''])[0]
+            with self.lock:
+                user_id = self.users.setdefault(login, str(1000 + len(self.users)))
+            return 200, {'data': [{'id': user_id, 'login': login.lower(), 'display_name': login}]}, rate_headers
+        if url.path == '/helix/videos':
+            if 'user_id' in query:
+                user_id = query['user_id'][0]
+                with self.lock:
+                    names = {v: k for k, v in self.users.items()}
+                    videos = self.videos.setdefault(user_id, user_videos(user_id, names.get(user_id, f'user{user_id}'), self.vods_per_user))
+            else:
+                with self.lock:
+                    videos = self.videos.setdefault('game', game_videos(self.vods_per_user))
+            first = int(query.get('first', ['20'])[0])
+            after = int(query.get('after', ['0'])[0])
+            page = videos[after:after + first]
+            pagination = {'cursor': str(after + first)} if after + first < len(videos) else {}
+            return 200, {'data': page, 'pagination': pagination}, rate_headers
+        return 404, {'error': 'Not Found', 'status': 404}, rate_headers
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Twitch Helix server")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--points', type=int, default=800, help="Rate limit points per minute")
+    parser.add_argument('--vods', type=int, default=250, help="Archive VODs per user")
+    args = parser.parse_args()
+    with MockHelix(args.port, args.points, args.vods) as mock:
+        print("Mock Helix running, point twitch_helper at it with:")
+        for name, value in mock.environment().items():
+            print(f"  export {name}={value}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            sys.exit(0)
@@ -0,0 +1,150 @@
+import os
+import sys
+import re
+import json
+import time
+import glob
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import app as app
+import img_helper as img_helper
+import hls_helper as hls_helper
+
+# Offline replay of img_helper.process_frames on a local video, for throughput and accuracy without a live VOD
+#   python benchmarks/replay.py video.mp4 [--labels labels.txt] [--coarse-threshold 12,15,18] [--json results.jsonl]
+# Run from the repo root, the templates and indexes are read from there
+# The video is a local file, a folder of HLS segments (its .m3u8, or its .ts files in name order),
+# or an m3u8 url replayed offline from a segment cache filled by hls_helper (--segment-cache)
+# The labels file has the time of each vote screen in the video, one per line, in seconds or [hh:]mm:ss,
+# anything after the first comma or space is ignored, as are # comments
+# A found vote screen is a hit when it is within --tolerance seconds of a label not already hit
+
+def parse_time(text):
+    seconds = 0.0
+    for part in text.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+def load_labels(path):
+    labels = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            field = re.split(r'[,\s]', line.split('#')[0].strip())[0]
+            try:
+                labels.append(parse_time(field))
+            except ValueError:
+                continue # blank line or header
+    return sorted(labels)
+
+# (hits, precision, recall) of found event times against labeled times, each label hit at most once
+def score(found, labels, tolerance):
+    unmatched = list(labels)
+    hits = 0
+    for t in sorted(found):
+        nearest = min(unmatched, key=lambda label: abs(label - t), default=None)
+        if nearest is not None and abs(nearest - t) <= tolerance:
+            unmatched.remove(nearest)
+            hits += 1
+    precision = hits / len(found) if found else 0.0
+    recall = hits / len(labels) if labels else 0.0
+    return hits, precision, recall
+
+# Input FFmpeg can open for a folder of HLS segments
+def segment_folder_source(folder):
+    playlists = sorted(glob.glob(os.path.join(folder, '*.m3u8')))
+    if playlists:
+        return playlists[0]
+    segments = glob.glob(os.path.join(folder, '*.ts'))
+    if not segments:
+        raise ValueError(f"No .m3u8 or .ts files in {folder}")
+    def order(path):
+        digits = re.findall(r'\d+', os.path.basename(path))
+        return (int(digits[-1]) if digits else -1, path)
+    return 'concat:' + '|'.join(sorted(segments, key=order))
+
+def replay(source, args, label):
+    stats = img_helper.ScanStats()
+    template_hashes_fine, template_hashes_coarse = app.get_templates()
+    os.makedirs(app.output_dir, exist_ok=True)
+    start = time.perf_counter()
+    img_helper.process_frames(source, template_hashes_fine, template_hashes_coarse, app.output_dir,
+                              'replay', args.video, '', app.regions, debug=args.debug,
+                              crop_at_decode=args.crop_at_decode, downscale_at_decode=args.downscale_at_decode, keyframes_only=args.keyframes_only,
+                              fast_votes=args.fast_votes, fast_maps=args.fast_maps, vote_consensus=args.vote_consensus,
+                              fine_keep=args.fine_keep, vod_duration=args.duration, stats=stats)
+    elapsed = time.perf_counter() - start
+    result = {
+        'run': label,
+        'video': args.video,
+        'coarse_threshold': img_helper.coarse_hash_threshold,
+        'fine_threshold': img_helper.fine_hash_threshold,
+        'crop_at_decode': args.crop_at_decode,
+        'downscale_at_decode': args.downscale_at_decode,
+        'seconds': round(elapsed, 2),
+        'frames_decoded': stats.frames_decoded,
+        'fps': round(stats.frames_decoded / elapsed, 1) if elapsed else 0.0,
+        'ffmpeg_starts': stats.ffmpeg_starts,
+        'hash_seconds': round(stats.hash_seconds, 3),
+        'ocr_seconds': round(stats.ocr_seconds, 3),
+        'events': [t for t, _ in stats.events],
+    }
+    print(f"{label}: {len(stats.events)} vote screen(s) in {elapsed:.1f}s, {stats.frames_decoded} frames decoded "
+          f"({result['fps']} frames/sec), FFmpeg started {stats.ffmpeg_starts} time(s)")
+    print(f"{' ' * len(label)}  hash {stats.hash_seconds:.2f}s, OCR {stats.ocr_seconds:.2f}s, "
+          f"other (decode, seeks) {elapsed - stats.hash_seconds - stats.ocr_seconds:.2f}s")
+    if args.labels:
+        labels = load_labels(args.labels)
+        hits, precision, recall = score(result['events'], labels, args.tolerance)
+        result.update(labels=len(labels), hits=hits, precision=round(precision, 3), recall=round(recall, 3))
+        print(f"{' ' * len(label)}  {hits} of {len(labels)} labeled screen(s) found, "
+              f"precision {precision:.3f}, recall {recall:.3f}")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline process_frames replay benchmark")
+    parser.add_argument('video', help="Local video file, folder of HLS segments, or m3u8 url with --segment-cache")
+    parser.add_argument('--labels', type=str, default=None, help="File with the time of each vote screen in the video")
+    parser.add_argument('--tolerance', type=float, default=25, help="Seconds a found vote screen may be off its label")
+    parser.add_argument('--segment-cache', type=str, default=None, help="hls_helper segment cache to replay the m3u8 url from, offline")
+    parser.add_argument('--duration', type=float, default=None, help="Video length in seconds, looked up with ffprobe when not given")
+    parser.add_argument('--coarse-threshold', type=str, default=str(img_helper.coarse_hash_threshold), help="Comma separated values to sweep")
+    parser.add_argument('--fine-threshold', type=str, default=str(img_helper.fine_hash_threshold), help="Comma separated values to sweep")
+    parser.add_argument('--crop-at-decode', type=app.str2bool, default=True)
+    parser.add_argument('--downscale-at-decode', type=app.str2bool, default=False)
+    parser.add_argument('--keyframes-only', type=app.str2bool, default=False)
+    parser.add_argument('--fast-votes', type=app.str2bool, default=True)
+    parser.add_argument('--fast-maps', type=app.str2bool, default=True)
+    parser.add_argument('--vote-consensus', type=str, default=None, choices=['max', 'majority'])
+    parser.add_argument('--fine-keep', type=int, default=3)
+    parser.add_argument('--debug', type=app.str2bool, default=False)
+    parser.add_argument('--json', type=str, default=None, help="File to append one JSON line per run to, to compare across changes")
+    args = parser.parse_args()
+
+    proxy = None
+    if args.segment_cache:
+        proxy = hls_helper.HlsProxy(hls_helper.SegmentCache(args.segment_cache), offline=True).start()
+        source = proxy.url_for(args.video)
+    elif os.path.isdir(args.video):
+        source = segment_folder_source(args.video)
+    else:
+        source = args.video
+
+    results = []
+    try:
+        for coarse in [int(v) for v in args.coarse_threshold.split(',')]:
+            for fine in [int(v) for v in args.fine_threshold.split(',')]:
+                img_helper.coarse_hash_threshold = coarse
+                img_helper.fine_hash_threshold = fine
+                results.append(replay(source, args, f"coarse {coarse} fine {fine}"))
+    finally:
+        if proxy:
+            proxy.stop()
+
+    if args.json:
+        with open(args.json, 'a', encoding='utf-8') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+
+if __name__ == "__main__":
+    main()
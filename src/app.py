@@ -2,8 +2,14 @@ import os
 import csv
 from datetime import datetime, timezone
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
 import img_helper as img_helper
+import ocr_helper as ocr_helper
+import checkpoint_helper as checkpoint_helper
+import db_helper as db_helper
+import stream_helper as stream_helper
+import hls_helper as hls_helper
 import twitch_helper as twitch_helper
 
 template_fine_dir = 'templates_fine'
@@ -22,81 +28,266 @@ regions = { # y1, y2, x1, x2
     'votes3_raw_text': (756 / ref_h, 787 / ref_h, 1339 / ref_w, 1448 / ref_w),
 }
 
-os.makedirs(output_dir, exist_ok=True)
-template_hashes_fine = img_helper.load_template_hashes(template_fine_dir)
-template_hashes_coarse = img_helper.load_template_hashes(template_coarse_dir)
-vods_triples = ()
-
 whitelist_raw_csv_path = 'vote_data_whitelisted.csv'
 random_raw_csv_path = 'vote_data_random.csv'
 
 def str2bool(v):
     return str(v).lower() in ("yes", "true", "t", "1")
-parser = argparse.ArgumentParser(description="Map Vote Data Script Configuration")
-parser.add_argument('--debug', type=str2bool, default=True, help="Enable debug mode")
-parser.add_argument('--whitelist', type=str2bool, default=True, help="Run on whitelisted streamers")
-parser.add_argument('--start-date', type=str, default="2025-07-18", help="Start date (Midnight UTC) in YYYY-MM-DD")
-parser.add_argument('--end-date', type=str, default="2025-07-22", help="End date (Midnight UTC) in YYYY-MM-DD")
-parser.add_argument('--vods-limit', type=int, default=500, help="Maximum number of VODs to process")
-args = parser.parse_args()
-start_date = datetime.strptime(args.start_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
-end_date = datetime.strptime(args.end_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
-debug_mode = args.debug
-run_whitelist = args.whitelist
-vods_limit = args.vods_limit
-print("Debug mode:", debug_mode)
-print("Whitelist mode:", run_whitelist)
-print("Start date:", start_date)
-print("End date:", end_date)
-print("VODs limit:", vods_limit)
-
-
-# Get vods from whitelisted, currently all vods after patch day not already in csv
-if run_whitelist:
-    print("Updating Whitelist Data")
-    # Load existing URLs from vote_data_whitelisted.csv
-    existing_urls = set()
-    if os.path.exists(whitelist_raw_csv_path):
-        with open(whitelist_raw_csv_path, 'r', newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            headers = next(reader, None)
-            for row in reader:
-                if len(row) >= 2:
-                    existing_urls.add(row[1])
-    vods_triples = twitch_helper.get_whitelist_overwatch_vods('whitelist.csv', start_date, end_date)
-    vods_triples = [v for v in vods_triples if v[1] not in existing_urls]
-
-# Get vods from random streamers
-else:
-    print("Updating Random Data")
-    full_vod_info = twitch_helper.get_random_overwatch_vods()
-    vods_triples = [(v['user_name'], v['url'], v['created_at']) for v in full_vod_info]
-
-vods_triples = vods_triples[:vods_limit] # TODO make random order?
-print(f"{len(vods_triples)} Vods Found.")
-
-for idx, (user_name, url, created_at) in enumerate(vods_triples):
-    print(f"{idx + 1} / {len(vods_triples)}: {user_name}: {url}, {created_at} has begun.")
+
+# Template hashes, loaded on first use and kept for the life of the process, so importing this module is cheap
+# and each worker process hashes the templates once, not once per VOD
+_templates = None
+
+def get_templates():
+    global _templates
+    if _templates is None:
+        _templates = (img_helper.load_template_hashes(template_fine_dir), img_helper.load_template_hashes(template_coarse_dir))
+    return _templates
+
+# Per worker process state, either a client of the shared OcrService,
+# or this process's own OCR model, loaded once and reused for every VOD it scrapes
+worker_reader = None
+
+def init_worker(ocr_client_args=None):
+    global worker_reader
+    if ocr_client_args:
+        worker_reader = ocr_helper.OcrClient.from_service(*ocr_client_args)
+    else:
+        worker_reader = ocr_helper.get_reader()
+
+# Scrapes a single (user_name, url, created_at, duration) VOD, runs in a worker process (or in process when --workers is 1)
+# scan_options are extra keyword arguments for img_helper.process_frames
+# With a checkpoint_dir the scan resumes from, and saves to, the VOD's checkpoint there
+# stream is the VOD's (m3u8_url, duration) when already resolved by stream_helper.prefetch, resolved here otherwise
+# Returns (vod, rows, finished, duration), rows of an unfinished scan stay in its checkpoint for the next run
+def scrape_vod(vod, debug_mode, scan_options, checkpoint_dir=None, stream=None):
+    global worker_reader
+    user_name, url, created_at, _ = vod
+    if worker_reader is None:
+        init_worker()
+
     # Get usable url
-    m3u8_url = img_helper.get_m3u8_url(url)
-    rows = []
+    m3u8_url, duration = stream or stream_helper.resolve(vod)
     if not m3u8_url:
-        print("Failed to get m3u8 url.")
-        continue
+        print(f"Failed to get m3u8 url for {url}.")
+        return vod, [], False, duration
+
+    template_hashes_fine, template_hashes_coarse = get_templates()
+    checkpoint = checkpoint_helper.VodCheckpoint(url, checkpoint_dir) if checkpoint_dir else None
+    stats = img_helper.ScanStats()
+    os.makedirs(output_dir, exist_ok=True)
+    rows = img_helper.process_frames(m3u8_url, template_hashes_fine, template_hashes_coarse,
+                                     output_dir, user_name, url, created_at, regions, debug=debug_mode,
+                                     reader=worker_reader, checkpoint=checkpoint, vod_duration=duration,
+                                     stats=stats, **scan_options)
+    return vod, rows, stats.finished, duration
+
+# Single writer, only the main process appends to the csv and the database so rows from different VODs are never interleaved
+def write_rows(output_csv, rows):
+    with open(output_csv, 'a', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=rows[0].keys())
+        for row in rows:
+            writer.writerow(row)
+
+# VODs to scrape, (user_name, url, created_at, duration) of the whitelist between start_date and end_date,
+# or of random streamers, leaving out any url in skip_urls, at most vods_limit of them
+def find_vods(run_whitelist, start_date, end_date, vods_limit, skip_urls=()):
+    skip_urls = set(skip_urls)
+
+    # Get vods from whitelisted, currently all vods after patch day not already in csv or the ledger
+    if run_whitelist:
+        print("Updating Whitelist Data")
+        # Load existing URLs from vote_data_whitelisted.csv
+        if os.path.exists(whitelist_raw_csv_path):
+            with open(whitelist_raw_csv_path, 'r', newline='') as csvfile:
+                reader = csv.reader(csvfile)
+                headers = next(reader, None)
+                for row in reader:
+                    if len(row) >= 2:
+                        skip_urls.add(row[1])
+        vods = twitch_helper.get_whitelist_overwatch_vods('whitelist.csv', start_date, end_date)
+        vods = [v for v in vods if v[1] not in skip_urls]
 
-    rows = img_helper.process_frames(m3u8_url, template_hashes_fine, template_hashes_coarse, 
-                                     output_dir, user_name, url, created_at, regions, debug=debug_mode)
-    if not rows:
-        print("No frames found.") # TODO Change to save vod url to csv so it isn't repeated
-        continue
+    # Get vods from random streamers
+    else:
+        print("Updating Random Data")
+        full_vod_info = twitch_helper.get_random_overwatch_vods()
+        vods = [twitch_helper.vod_tuple(v) for v in full_vod_info if v['url'] not in skip_urls]
+
+    return vods[:vods_limit] # TODO make random order?
+
+# Scrapes vods into the database at db_path (and output_csv, if given) under source
+# workers > 1 scrapes that many VODs at once, each in its own process, sharing one OCR model if ocr_service
+# Stream urls and durations of the next prefetch VODs are resolved in background threads meanwhile,
+# and cached in stream_cache (a path, empty to disable) for retries
+# With a segment_cache folder, FFmpeg reads every VOD through an hls_helper.HlsProxy that keeps up to
+# segment_cache_gb of segments on disk, so rewinds and rescans do not download them again
+# Returns the number of VODs that finished
+def run_pipeline(vods, source, db_path=db_helper.db_path, output_csv=None, workers=1, debug_mode=False,
+                 scan_options=None, checkpoint_dir=checkpoint_helper.checkpoint_dir, ocr_service=True,
+                 prefetch=2, stream_cache=stream_helper.stream_cache_path, segment_cache=None,
+                 segment_cache_gb=hls_helper.segment_cache_gb):
+    scan_options = scan_options or {}
+    workers = max(1, workers)
+    db = db_helper.connect(db_path)
+    cache = stream_helper.StreamCache(stream_cache) if stream_cache else None
+    resolved = stream_helper.prefetch(vods, cache, depth=prefetch)
+    streams = resolved
+    proxy = None
+    if segment_cache:
+        proxy = hls_helper.HlsProxy(hls_helper.SegmentCache(segment_cache, int(segment_cache_gb * 1024 ** 3))).start()
+        streams = ((vod, (proxy.url_for(m3u8_url) if m3u8_url else None, duration)) for vod, (m3u8_url, duration) in resolved)
+    finished_count = 0
+    handled_count = 0
+
+    def handle_result(vod, rows, finished, duration):
+        nonlocal finished_count, handled_count
+        user_name, url, created_at, _ = vod
+        handled_count += 1
+        if not finished:
+            # Rows stay in the VOD's checkpoint, the next run resumes the scan, without checkpoints it starts over
+            kept = f"kept {len(rows)} row(s) for the next run" if checkpoint_dir else "it will be scanned again on the next run"
+            print(f"{handled_count} / {len(vods)}: {user_name}: {url}, {created_at} did not finish, {kept}.")
+            db_helper.record_vod(db, url, user_name, created_at, db_helper.status_failed, duration, len(rows), img_helper.scanner_version)
+            return
+        print(f"{handled_count} / {len(vods)}: {user_name}: {url}, {created_at} has finished.")
+        if rows:
+            db_helper.insert_raw_rows(db, rows, source)
+            if output_csv:
+                write_rows(output_csv, rows)
+        else:
+            print("No frames found.")
+        db_helper.record_vod(db, url, user_name, created_at, db_helper.status_done, duration, len(rows), img_helper.scanner_version)
+        if checkpoint_dir:
+            checkpoint_helper.VodCheckpoint(url, checkpoint_dir).remove()
+        finished_count += 1
+
+    # One VOD at a time, in this process
+    if workers == 1:
+        try:
+            for idx, (vod, stream) in enumerate(streams):
+                user_name, url, created_at, _ = vod
+                print(f"{idx + 1} / {len(vods)}: {user_name}: {url}, {created_at} has begun.")
+                handle_result(*scrape_vod(vod, debug_mode, scan_options, checkpoint_dir, stream))
+        finally:
+            resolved.close()
+            db.close()
+            if proxy:
+                proxy.stop()
+        return finished_count
+
+    # N VODs at once, each worker has its own FFmpeg pipe, rows are written here as VODs finish
+    # A VOD goes to the pool once its stream is resolved and a worker is free, so its url is fresh when the scan starts
+    # OCR goes to one shared model in a sidecar process, or each worker loads its own without ocr_service
+    service = ocr_helper.OcrService(workers).start() if ocr_service else None
+    initargs = (service.client_args(),) if service else ()
+
+    def handle_done(futures):
+        for future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Worker failed: {e}")
+                continue
+            handle_result(*result)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs) as executor:
+            running = set()
+            for vod, stream in streams:
+                if not stream[0]:
+                    print(f"Failed to get m3u8 url for {vod[1]}.")
+                    handle_result(vod, [], False, stream[1])
+                    continue
+                if len(running) >= workers:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    handle_done(done)
+                running.add(executor.submit(scrape_vod, vod, debug_mode, scan_options, checkpoint_dir, stream))
+            handle_done(as_completed(running))
+    finally:
+        resolved.close()
+        db.close()
+        if proxy:
+            proxy.stop()
+        if service:
+            service.stop()
+    return finished_count
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Map Vote Data Script Configuration")
+    parser.add_argument('--debug', type=str2bool, default=True, help="Enable debug mode")
+    parser.add_argument('--whitelist', type=str2bool, default=True, help="Run on whitelisted streamers")
+    parser.add_argument('--start-date', type=str, default="2025-07-18", help="Start date (Midnight UTC) in YYYY-MM-DD")
+    parser.add_argument('--end-date', type=str, default="2025-07-22", help="End date (Midnight UTC) in YYYY-MM-DD")
+    parser.add_argument('--vods-limit', type=int, default=500, help="Maximum number of VODs to process")
+    parser.add_argument('--workers', type=int, default=1, help="Number of VODs to scrape at once, each in its own process")
+    parser.add_argument('--crop-at-decode', type=str2bool, default=True, help="Have FFmpeg pipe only the vote banner while scanning")
+    parser.add_argument('--downscale-at-decode', type=str2bool, default=False, help="Have FFmpeg also shrink the banner to pHash size")
+    parser.add_argument('--keyframes-only', type=str2bool, default=False, help="Decode only keyframes during the coarse pass")
+    parser.add_argument('--ocr-service', type=str2bool, default=True, help="With several workers, share one OCR model in a sidecar process")
+    parser.add_argument('--fast-votes', type=str2bool, default=True, help="Read vote counts with the templates_votes classifier before EasyOCR")
+    parser.add_argument('--collect-vote-crops', type=str, default=None, help="Folder to save EasyOCR labeled vote crops to, e.g. templates_votes")
+    parser.add_argument('--fast-maps', type=str2bool, default=True, help="Look up map names in map_title_index.csv before EasyOCR")
+    parser.add_argument('--vote-consensus', type=str, default=None, choices=['max', 'majority'], help="Combine vote counts across all fine matches")
+    parser.add_argument('--fine-keep', type=int, default=3, help="Number of best fine-grained matches held in memory per vote screen")
+    parser.add_argument('--collect-map-crops', type=str, default=None, help="Folder to save EasyOCR labeled map title crops to, e.g. templates_maps")
+    parser.add_argument('--db', type=str, default=db_helper.db_path, help="SQLite database with the processed VOD ledger and raw rows")
+    parser.add_argument('--write-csv', type=str2bool, default=True, help="Also append raw rows to the raw csv, as well as the database")
+    parser.add_argument('--rescan-older', type=str2bool, default=False, help="Scan again VODs finished by an older scanner version")
+    parser.add_argument('--checkpoint-dir', type=str, default=checkpoint_helper.checkpoint_dir, help="Folder for per VOD scan checkpoints, empty to disable")
+    parser.add_argument('--prefetch', type=int, default=2, help="Number of upcoming VODs whose stream url and duration are resolved during scans")
+    parser.add_argument('--stream-cache', type=str, default=stream_helper.stream_cache_path, help="File caching resolved stream urls and durations, empty to disable")
+    parser.add_argument('--segment-cache', type=str, default='', help="Folder to cache HLS segments in, e.g. segment_cache, empty to disable")
+    parser.add_argument('--segment-cache-gb', type=float, default=hls_helper.segment_cache_gb, help="Disk budget of the segment cache, least recently used segments are evicted past it")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    start_date = datetime.strptime(args.start_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    end_date = datetime.strptime(args.end_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    debug_mode = args.debug
+    run_whitelist = args.whitelist
+    vods_limit = args.vods_limit
+    workers = max(1, args.workers)
+    print("Debug mode:", debug_mode)
+    print("Whitelist mode:", run_whitelist)
+    print("Start date:", start_date)
+    print("End date:", end_date)
+    print("VODs limit:", vods_limit)
+    print("Workers:", workers)
+    scan_options = {
+        'crop_at_decode': args.crop_at_decode,
+        'downscale_at_decode': args.downscale_at_decode,
+        'keyframes_only': args.keyframes_only,
+        'fast_votes': args.fast_votes,
+        'collect_dir': args.collect_vote_crops,
+        'fast_maps': args.fast_maps,
+        'collect_maps_dir': args.collect_map_crops,
+        'vote_consensus': args.vote_consensus,
+        'fine_keep': max(1, args.fine_keep),
+    }
+
+    # Every finished VOD is in the ledger, with or without rows, so it is never scanned twice
+    db = db_helper.connect(args.db)
+    processed_urls = db_helper.processed_urls(db, min_version=img_helper.scanner_version if args.rescan_older else None)
+    db.close()
+    print(f"{len(processed_urls)} VODs in the processed ledger.")
+
+    vods = find_vods(run_whitelist, start_date, end_date, vods_limit, processed_urls)
+    print(f"{len(vods)} Vods Found.")
 
     if run_whitelist:
         output_csv = whitelist_raw_csv_path
+        source = db_helper.source_whitelist
     else:
         output_csv = random_raw_csv_path
+        source = db_helper.source_random
 
-    with open(output_csv, 'a', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=rows[0].keys())
-        for row in rows:
-            writer.writerow(row)
-            
+    run_pipeline(vods, source, db_path=args.db, output_csv=output_csv if args.write_csv else None,
+                 workers=workers, debug_mode=debug_mode, scan_options=scan_options,
+                 checkpoint_dir=args.checkpoint_dir, ocr_service=args.ocr_service,
+                 prefetch=max(0, args.prefetch), stream_cache=args.stream_cache,
+                 segment_cache=args.segment_cache, segment_cache_gb=args.segment_cache_gb)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import os
+import json
+import time
+import hashlib
+
+# Per VOD scan checkpoints, so an interrupted scan resumes where it stopped instead of starting over
+# checkpoints/<url hash>.json holds the next coarse sample time and the rows found so far,
+# rewritten whenever a row is found and every save_interval seconds of scanning
+# Rows only go to the csv once the scan finishes, then the checkpoint is removed
+
+checkpoint_dir = 'checkpoints'
+
+class VodCheckpoint:
+    def __init__(self, url, folder=checkpoint_dir, save_interval=30):
+        self.url = url
+        self.path = os.path.join(folder, hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + '.json')
+        self.save_interval = save_interval
+        self.current_time = 0
+        self.rows = []
+        self.one_coarse_match_found = False
+        self.finished = False # set by process_frames when the scan reaches its end
+        self.last_save = time.time()
+        self.load()
+
+    # True when there is a saved position to resume from
+    @property
+    def resumed(self):
+        return self.current_time > 0 or bool(self.rows)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable checkpoint {self.path}: {e}")
+            return
+        if state.get('url') != self.url:
+            return
+        self.current_time = state.get('current_time', 0)
+        self.rows = state.get('rows', [])
+        self.one_coarse_match_found = state.get('one_coarse_match_found', False)
+
+    # Written to a temporary file first, so a crash mid write never leaves a broken checkpoint
+    def save(self, current_time, rows, one_coarse_match_found):
+        self.current_time = current_time
+        self.rows = list(rows)
+        self.one_coarse_match_found = one_coarse_match_found
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        state = {
+            'url': self.url,
+            'current_time': current_time,
+            'one_coarse_match_found': one_coarse_match_found,
+            'rows': self.rows,
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+        self.last_save = time.time()
+
+    # Saves if save_interval seconds have passed since the last save
+    def maybe_save(self, current_time, rows, one_coarse_match_found):
+        if time.time() - self.last_save >= self.save_interval:
+            self.save(current_time, rows, one_coarse_match_found)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
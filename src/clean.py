@@ -1,3 +1,9 @@
+import os
+import io
+import sys
+import json
+import hashlib
+import numpy as np
 import pandas as pd
 from rapidfuzz import fuzz, process
 
@@ -30,28 +36,139 @@ def fix_map_name(map_name, valid_maps, threshold=80):
         return match
     return None
 
+raw_column_names = ['user_name', 'url', 'created_at', 'map1', 'votes1', 'map2', 'votes2', 'map3', 'votes3']
+dedupe_columns = ['map1', 'votes1', 'map2', 'votes2', 'map3', 'votes3', 'created_at']
+
+# Learned alias table of OCR map names, raw_name (uppercased OCR text), map_name (best match in overwatch_maps) and score
+# OCR repeats the same misreads, so each distinct name is fuzzy matched once, and the table grows as new ones appear
+map_aliases_path = 'map_aliases.csv'
+_map_aliases = None
+_map_aliases_loaded_from = None
+
+# {raw_name: (map_name, score)}, loaded from map_aliases_path once per process
+def load_map_aliases():
+    global _map_aliases, _map_aliases_loaded_from
+    if _map_aliases is None or _map_aliases_loaded_from != map_aliases_path:
+        _map_aliases = {}
+        _map_aliases_loaded_from = map_aliases_path
+        if os.path.exists(map_aliases_path):
+            aliases = pd.read_csv(map_aliases_path, dtype={'raw_name': str, 'map_name': str}, keep_default_na=False)
+            _map_aliases = dict(zip(aliases['raw_name'], zip(aliases['map_name'], aliases['score'])))
+    return _map_aliases
+
+# Best overwatch_maps match and score of each name, all names scored in one process.cdist call
+def match_map_names(names):
+    scores = process.cdist(names, overwatch_maps, scorer=fuzz.ratio, dtype=np.float64, workers=-1)
+    best = scores.argmax(axis=1)
+    return [(overwatch_maps[i], float(score)) for i, score in zip(best, scores[np.arange(len(names)), best])]
+
+# Fuzzy matches map1-3 to overwatch_maps, None where there is no match (same result as fix_map_name on each cell)
+# Names not in the alias table yet are matched in bulk and appended to it
+def fix_map_columns(df, threshold=80):
+    aliases = load_map_aliases()
+    names = pd.unique(pd.concat([df[col] for col in ['map1', 'map2', 'map3']]).dropna())
+    unseen = [name for name in names if name not in aliases and name.strip()]
+    if unseen:
+        matches = match_map_names(unseen)
+        aliases.update(zip(unseen, matches))
+        new_aliases = pd.DataFrame([(name, map_name, score) for name, (map_name, score) in zip(unseen, matches)],
+                                   columns=['raw_name', 'map_name', 'score'])
+        new_aliases.to_csv(map_aliases_path, mode='a', header=not os.path.exists(map_aliases_path), index=False)
+
+    fixed = {name: alias[0] for name, alias in aliases.items() if alias[1] >= threshold}
+    for col in ['map1', 'map2', 'map3']:
+        df[col] = df[col].map(fixed)
+    return df
+
 # Cleans map_vote data, saves to output_file and returns df
-def clean_vote_data(input_file, output_file):
+# incremental only cleans the raw rows added since the last run, dedupes them against the rows already in output_file,
+# and appends the new ones, returning only those. Falls back to a full clean when there is no usable state file
+def clean_vote_data(input_file, output_file, incremental=False):
+    if incremental:
+        df = clean_new_vote_data(input_file, output_file)
+        if df is not None:
+            return df
+
     # Read input file
-    column_names = ['user_name', 'url', 'created_at', 'map1', 'votes1', 'map2', 'votes2', 'map3', 'votes3']
-    df = pd.read_csv(input_file, names=column_names, header=None)
+    df = pd.read_csv(input_file, names=raw_column_names, header=None)
+    df = clean_vote_frame(df)
+    df.to_csv(output_file, index=False)
+    save_clean_state(input_file, output_file, df)
+    return df
 
-    # if any vote column is just "VOTE" add 1 to the front
-    for col in ['votes1', 'votes2', 'votes3']:
-        df[col] = df[col].apply(lambda x: '1' + str(x) if str(x) == 'VOTE' else x)
+# High-water mark of incremental cleaning, next to the cleaned file
+# raw_bytes is how far into the raw csv has been cleaned, raw_tail a hash of the bytes just before it, to notice a rewritten raw file,
+# and keys the dedupe key of every cleaned row
+def clean_state_path(output_file):
+    return os.path.splitext(output_file)[0] + '_state.json'
 
-    # For votes columns, get the first character, and if it isnt a number, remove the whole row
+def dedupe_keys(df):
+    return ['|'.join(str(v) for v in key) for key in df[dedupe_columns].itertuples(index=False, name=None)]
+
+def _raw_tail(input_file, raw_bytes):
+    with open(input_file, 'rb') as f:
+        f.seek(max(0, raw_bytes - 1024))
+        return hashlib.sha1(f.read(raw_bytes - f.tell())).hexdigest()
+
+def save_clean_state(input_file, output_file, df, keys=None):
+    raw_bytes = os.path.getsize(input_file)
+    state = {
+        'raw_bytes': raw_bytes,
+        'raw_tail': _raw_tail(input_file, raw_bytes),
+        'keys': keys if keys is not None else dedupe_keys(df),
+    }
+    with open(clean_state_path(output_file), 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+
+# Incremental part of clean_vote_data, returns the newly appended rows, or None if a full clean is needed
+def clean_new_vote_data(input_file, output_file):
+    state_path = clean_state_path(output_file)
+    if not os.path.exists(state_path) or not os.path.exists(output_file):
+        return None
+    with open(state_path, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    raw_bytes = state['raw_bytes']
+    if os.path.getsize(input_file) < raw_bytes or _raw_tail(input_file, raw_bytes) != state['raw_tail']:
+        return None
+
+    # Only the bytes appended since the last run are read
+    with open(input_file, 'rb') as f:
+        f.seek(raw_bytes)
+        new_data = f.read()
+    if new_data.strip():
+        new_raw = pd.read_csv(io.BytesIO(new_data), names=raw_column_names, header=None, dtype=str)
+        df = clean_vote_frame(new_raw)
+    else:
+        df = pd.DataFrame(columns=raw_column_names)
+
+    # Duplicates of earlier rows, and within the new rows, are dropped before appending
+    keys = set(state['keys'])
+    new_keys = dedupe_keys(df) if len(df) else []
+    keep = []
+    for key in new_keys:
+        keep.append(key not in keys)
+        keys.add(key)
+    df = df[keep] if len(df) else df
+    if len(df):
+        df.to_csv(output_file, mode='a', header=False, index=False)
+    save_clean_state(input_file, output_file, df, state['keys'] + [key for key, kept in zip(new_keys, keep) if kept])
+    return df
+
+# Cleans a dataframe of raw rows (columns raw_column_names), returns the cleaned df
+def clean_vote_frame(df):
+    # Vote counts from the vote text, rows where any count can't be read are removed
     for col in ['votes1', 'votes2', 'votes3']:
-        df[col] = df[col].apply(lambda x: x[0] if str(x)[0].isdigit() else None)
+        df[col] = parse_vote_counts(df[col])
     df = df.dropna(subset=['votes1', 'votes2', 'votes3'])
+    for col in ['votes1', 'votes2', 'votes3']:
+        df[col] = df[col].astype(int)
     
     # Convert maps to uppercase
     for col in ['map1', 'map2', 'map3']:
         df[col] = df[col].str.upper()
     
     # Fix names to fuzzy match overwatch_maps
-    for col in ['map1', 'map2', 'map3']:
-        df[col] = df[col].apply(lambda x: fix_map_name(x, overwatch_maps))
+    df = fix_map_columns(df)
     
     # Drop rows with NaN in map columns
     df = df.dropna(subset=['map1', 'map2', 'map3'])
@@ -61,10 +178,10 @@ def clean_vote_data(input_file, output_file):
     df['created_at'] = df['created_at'].dt.date
     
     # Remove duplicate votes from same created_at date
-    df = df.drop_duplicates(subset=['map1', 'votes1', 'map2', 'votes2', 'map3', 'votes3', 'created_at'], keep='first')
+    df = df.drop_duplicates(subset=dedupe_columns, keep='first')
     
     # Get total votes, remove row if below 2 or above 10
-    df['total_votes'] = df[['votes1', 'votes2', 'votes3']].apply(lambda x: sum(int(v) for v in x if str(v).isdigit()), axis=1)
+    df['total_votes'] = df[['votes1', 'votes2', 'votes3']].sum(axis=1)
     df = df[df['total_votes'] > 1]
     df = df[df['total_votes'] <= 10]
     
@@ -74,14 +191,36 @@ def clean_vote_data(input_file, output_file):
     df['percent3'] = df['votes3'].astype(int) / df['total_votes']
 
     # Calculate winner (majority votes)
-    df['winner'] = df.apply(lambda row: row['map1'] if row['votes1'] > row['votes2'] and row['votes1'] > row['votes3'] 
-                            else (row['map2'] if row['votes2'] > row['votes1'] and row['votes2'] > row['votes3'] 
-                                else (row['map3'] if row['votes3'] > row['votes1'] and row['votes3'] > row['votes2'] 
-                                        else 'draw')), axis=1)
-    
-    df.to_csv(output_file, index=False)
+    df['winner'] = get_winners(df)
     return df
 
+# Vote count from vote text: "VOTE" alone is 1, "10..." is 10, otherwise the first character if it is a digit
+# Counts as floats, NaN where there is no count
+def parse_vote_counts(votes):
+    text = votes.astype(str)
+    text = text.mask(text == 'VOTE', '1VOTE')
+    first = text.str[0]
+    counts = pd.to_numeric(first.where(first.str.isdigit().fillna(False).astype(bool)), errors='coerce')
+    return counts.mask(text.str.startswith('10'), 10)
+
+# Card (1, 2 or 3) with strictly the most votes, 0 when the top count is tied
+def get_winning_cards(df):
+    votes = df[['votes1', 'votes2', 'votes3']].to_numpy()
+    if len(votes) == 0:
+        return pd.Series([], index=df.index, dtype=int)
+    top = votes.max(axis=1, keepdims=True)
+    unique_top = (votes == top).sum(axis=1) == 1
+    return pd.Series(np.where(unique_top, votes.argmax(axis=1) + 1, 0), index=df.index)
+
+# Map with strictly the most votes, 'draw' when the top count is tied
+def get_winners(df):
+    if len(df) == 0:
+        return pd.Series([], index=df.index, dtype=str)
+    cards = get_winning_cards(df).to_numpy()
+    maps = df[['map1', 'map2', 'map3']].to_numpy()
+    best = maps[np.arange(len(maps)), np.maximum(cards - 1, 0)]
+    return pd.Series(np.where(cards > 0, best, 'draw'), index=df.index)
+
 # Tiers based on half standard deviations
 def get_tier(p):
     if p >= 0.84:
@@ -97,23 +236,30 @@ def get_tier(p):
     else:
         return "F"
 
+map_types = {**{name: 'Control' for name in control_maps}, **{name: 'Escort' for name in escort_maps},
+             **{name: 'Flashpoint' for name in flashpoint_maps}, **{name: 'Hybrid' for name in hybrid_maps},
+             **{name: 'Push' for name in push_maps}}
+cube_keys = ['created_at', 'user_name', 'Map Name', 'Map Type']
+
 # Takes in cleaned_df (from clean_vote_data)
 # Returns Dataframe with columns Map Name, Appearances, Total Votes, Total Percent of Votes
 def summarize_vote_data(df):
-    # Melt the dataframe to long format
-    maps = df[['map1', 'votes1', 'percent1']].rename(columns={'map1': 'Map Name', 'votes1': 'Votes', 'percent1': 'Percent'})
-    maps2 = df[['map2', 'votes2', 'percent2']].rename(columns={'map2': 'Map Name', 'votes2': 'Votes', 'percent2': 'Percent'})
-    maps3 = df[['map3', 'votes3', 'percent3']].rename(columns={'map3': 'Map Name', 'votes3': 'Votes', 'percent3': 'Percent'})
+    return summarize_cube(vote_cube(df))
+
+# Pre-aggregated (date, streamer, map) cube of cleaned_df, every measure is a sum
+# so any slice of it can be summed and passed to summarize_cube
+def vote_cube(df):
+    # Melt the dataframe to long format, only the card with the most votes wins, so an event counts one win at most
+    # even when OCR read the same map on two cards
+    winning_cards = get_winning_cards(df)
+    cards = [df[['created_at', 'user_name', f'map{i}', f'votes{i}', f'percent{i}']]
+             .rename(columns={f'map{i}': 'Map Name', f'votes{i}': 'Votes', f'percent{i}': 'Percent'})
+             .assign(Wins=(winning_cards == i).astype(int)) for i in (1, 2, 3)]
+    all_maps = pd.concat(cards, ignore_index=True)
+    all_maps['created_at'] = all_maps['created_at'].astype(str)
 
-    all_maps = pd.concat([maps, maps2, maps3], ignore_index=True)
-    
     # Add map type column
-    all_maps['Map Type'] = all_maps['Map Name'].apply(lambda x: 'Control' if x in control_maps else
-                                                                'Escort' if x in escort_maps else
-                                                                'Flashpoint' if x in flashpoint_maps else
-                                                                'Hybrid' if x in hybrid_maps else
-                                                                'Push' if x in push_maps else
-                                                                'Unknown')
+    all_maps['Map Type'] = all_maps['Map Name'].map(map_types).fillna('Unknown')
 
     # Ensure correct types
     all_maps['Votes'] = pd.to_numeric(all_maps['Votes'], errors='coerce')
@@ -121,10 +267,21 @@ def summarize_vote_data(df):
     all_maps = all_maps.dropna(subset=['Map Name', 'Votes', 'Percent'])
 
     # Group and aggregate
-    summary = all_maps.groupby(['Map Name', 'Map Type']).agg(
+    return all_maps.groupby(cube_keys).agg(
         Appearances=('Map Name', 'count'),
         Total_Votes=('Votes', 'sum'),
-        Total_Percent_of_Votes=('Percent', 'sum')
+        Total_Percent_of_Votes=('Percent', 'sum'),
+        Total_Wins=('Wins', 'sum'),
+    ).reset_index()
+
+# Map summary of a (possibly sliced) vote_cube
+# Returns Dataframe with columns Map Name, Map Type, Appearances, Total Votes, Total Percent of Votes, per appearance values, Tier and wins
+def summarize_cube(cube):
+    summary = cube.groupby(['Map Name', 'Map Type']).agg(
+        Appearances=('Appearances', 'sum'),
+        Total_Votes=('Total_Votes', 'sum'),
+        Total_Percent_of_Votes=('Total_Percent_of_Votes', 'sum'),
+        Total_Wins=('Total_Wins', 'sum'),
     ).reset_index()
     
     # Add columns votes per appearance and percent per appearance
@@ -135,14 +292,107 @@ def summarize_vote_data(df):
     percentiles = summary["Votes_per_Appearance"].rank(pct=True)
     summary["Tier"] = percentiles.apply(get_tier)
 
-    # Count wins (based on majority votes)
-    win_counts = df[df['winner'] != 'draw']['winner'].value_counts()
-    summary['Total_Wins'] = summary['Map Name'].map(win_counts).fillna(0).astype(int)
+    summary['Total_Wins'] = summary.pop('Total_Wins').astype(int)
     summary['Win_Percentage'] = (summary['Total_Wins'] / summary['Appearances']).round(3)
     
     return summary
     
 
+# Dashboard artifacts, small parquet files the streamlit app loads instead of the cleaned csv
+# Their size depends on the number of maps and vote counts, not the number of vote events
+# Bump summary_artifact_version when the files or their columns change
+summary_artifact_version = 2
+card_names = {'votes1': 'Left', 'votes2': 'Middle', 'votes3': 'Right'}
+
+def summary_dir(output_file):
+    return os.path.splitext(output_file)[0] + '_summary'
+
+# Key columns of each additive artifact, the rest of its columns are summed when artifacts are merged
+additive_artifact_keys = {
+    'cube': cube_keys,
+    'votes_by_card': ['Card'],
+    'vote_distribution': ['Card', 'Votes'],
+    'total_votes': ['total_votes'],
+}
+
+# Chart ready aggregates of cleaned_df, {name: dataframe}
+# cube: vote_cube, for filtered summaries, map_summary: summarize_cube of the whole cube, votes_by_card: total votes per card,
+# vote_distribution: events per card and vote count, total_votes: events per total vote count
+def summary_artifacts(df):
+    votes = df[list(card_names)].rename(columns=card_names)
+    votes_by_card = votes.sum().rename_axis('Card').reset_index(name='Votes')
+    vote_distribution = (votes.melt(var_name='Card', value_name='Votes')
+                         .groupby(['Card', 'Votes']).size().reset_index(name='Events'))
+    total_votes = df.groupby('total_votes').size().reset_index(name='Events')
+    cube = vote_cube(df)
+    return {
+        'cube': cube,
+        'map_summary': summarize_cube(cube),
+        'votes_by_card': votes_by_card,
+        'vote_distribution': vote_distribution,
+        'total_votes': total_votes,
+    }
+
+# Adds the artifacts of newly cleaned rows to existing ones, the map summary is rebuilt from the merged cube
+def merge_summary_artifacts(artifacts, new_artifacts):
+    merged = {}
+    for name, keys in additive_artifact_keys.items():
+        merged[name] = pd.concat([artifacts[name], new_artifacts[name]], ignore_index=True).groupby(keys).sum().reset_index()
+    merged['map_summary'] = summarize_cube(merged['cube'])
+    return merged
+
+# Writes the artifacts to folder, the manifest goes last so a reader never sees it next to half written files
+def write_summary_artifacts(artifacts, folder):
+    os.makedirs(folder, exist_ok=True)
+    for name, artifact in artifacts.items():
+        artifact.to_parquet(os.path.join(folder, f'{name}.parquet'), index=False)
+    manifest = {
+        'version': summary_artifact_version,
+        'artifacts': sorted(artifacts),
+        'events': int(artifacts['total_votes']['Events'].sum()),
+    }
+    with open(os.path.join(folder, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+# Artifacts from folder, None if missing or written by another version
+def read_summary_artifacts(folder):
+    manifest_path = os.path.join(folder, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != summary_artifact_version:
+        return None
+    return {name: pd.read_parquet(os.path.join(folder, f'{name}.parquet')) for name in manifest['artifacts']}
+
+# Hash of the artifact files, changes whenever clean.py writes new ones
+def summary_hash(folder):
+    digest = hashlib.sha1()
+    if os.path.isdir(folder):
+        for name in sorted(os.listdir(folder)):
+            with open(os.path.join(folder, name), 'rb') as f:
+                digest.update(name.encode('utf-8'))
+                digest.update(f.read())
+    return digest.hexdigest()
+
+# Cleans input_file into output_file and updates its dashboard artifacts
+# Incrementally, only the new rows are summarized and added to the existing artifacts
+def update_vote_data(input_file, output_file, incremental=True):
+    folder = summary_dir(output_file)
+    artifacts = read_summary_artifacts(folder) if incremental else None
+    new_rows = clean_new_vote_data(input_file, output_file) if artifacts is not None else None
+    if new_rows is None:
+        artifacts = summary_artifacts(clean_vote_data(input_file, output_file))
+    elif len(new_rows):
+        artifacts = merge_summary_artifacts(artifacts, summary_artifacts(new_rows))
+    write_summary_artifacts(artifacts, folder)
+    return artifacts
+
 # Run on whitelisted data
+# --full cleans everything again instead of only new raw rows, --summary only rebuilds the dashboard artifacts from the cleaned csv
 if __name__ == "__main__":
-    clean_vote_data('vote_data_whitelisted.csv', 'vote_data_whitelisted_cleaned.csv')
\ No newline at end of file
+    if '--summary' in sys.argv:
+        cleaned = pd.read_csv('vote_data_whitelisted_cleaned.csv')
+        write_summary_artifacts(summary_artifacts(cleaned), summary_dir('vote_data_whitelisted_cleaned.csv'))
+    else:
+        update_vote_data('vote_data_whitelisted.csv', 'vote_data_whitelisted_cleaned.csv', incremental='--full' not in sys.argv)
\ No newline at end of file
@@ -0,0 +1,272 @@
+import os
+import sys
+import hashlib
+import sqlite3
+from datetime import datetime, timezone
+import pandas as pd
+
+import clean as clean
+
+# Local SQLite store, vote_data.db
+# processed_vods is the ledger of every VOD a scan finished (or failed) on, including VODs with no vote screens,
+# keyed by url so reruns can skip finished work without rescanning
+# raw_votes holds the OCR rows as scraped, clean_votes the output of clean.clean_vote_frame, map_summary the output
+# of clean.summarize_vote_data, so readers can query by streamer, date or map instead of rereading whole csvs
+# Rebuild the clean tables with: python src/db_helper.py clean
+# Import the existing csvs once with: python src/db_helper.py import
+# The database itself stays out of git, the ledger is kept as text in processed_vods.csv instead:
+# python src/db_helper.py import-ledger before a run, python src/db_helper.py export-ledger after it
+
+db_path = 'vote_data.db'
+ledger_csv_path = 'processed_vods.csv'
+
+# Statuses in processed_vods
+status_done = 'done' # scan reached the end of the VOD, rows_found can be 0
+status_failed = 'failed' # no stream url, or the scan stopped on an error
+
+ledger_schema = '''
+CREATE TABLE IF NOT EXISTS processed_vods (
+    url TEXT PRIMARY KEY,
+    user_name TEXT,
+    created_at TEXT,
+    status TEXT NOT NULL,
+    duration REAL,
+    rows_found INTEGER NOT NULL DEFAULT 0,
+    scanner_version TEXT,
+    processed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS processed_vods_status ON processed_vods (status);
+'''
+
+results_schema = '''
+CREATE TABLE IF NOT EXISTS raw_votes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    user_name TEXT,
+    url TEXT,
+    created_at TEXT,
+    map1 TEXT,
+    votes1 TEXT,
+    map2 TEXT,
+    votes2 TEXT,
+    map3 TEXT,
+    votes3 TEXT
+);
+CREATE INDEX IF NOT EXISTS raw_votes_user_name ON raw_votes (user_name);
+CREATE INDEX IF NOT EXISTS raw_votes_url ON raw_votes (url);
+CREATE INDEX IF NOT EXISTS raw_votes_created_at ON raw_votes (created_at);
+
+CREATE TABLE IF NOT EXISTS clean_votes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    user_name TEXT,
+    url TEXT,
+    created_at TEXT,
+    map1 TEXT,
+    votes1 INTEGER,
+    map2 TEXT,
+    votes2 INTEGER,
+    map3 TEXT,
+    votes3 INTEGER,
+    total_votes INTEGER,
+    percent1 REAL,
+    percent2 REAL,
+    percent3 REAL,
+    winner TEXT
+);
+CREATE INDEX IF NOT EXISTS clean_votes_source_date ON clean_votes (source, created_at);
+CREATE INDEX IF NOT EXISTS clean_votes_user_name ON clean_votes (user_name, created_at);
+CREATE INDEX IF NOT EXISTS clean_votes_map1 ON clean_votes (map1);
+CREATE INDEX IF NOT EXISTS clean_votes_map2 ON clean_votes (map2);
+CREATE INDEX IF NOT EXISTS clean_votes_map3 ON clean_votes (map3);
+
+CREATE TABLE IF NOT EXISTS imported_files (
+    path TEXT PRIMARY KEY,
+    sha1 TEXT,
+    table_name TEXT,
+    rows INTEGER,
+    imported_at TEXT NOT NULL
+);
+'''
+
+# Raw rows come from the whitelist or the random streamer scrape, kept apart like their csvs
+source_whitelist = 'whitelist'
+source_random = 'random'
+
+clean_columns = ['user_name', 'url', 'created_at', 'map1', 'votes1', 'map2', 'votes2', 'map3', 'votes3',
+                 'total_votes', 'percent1', 'percent2', 'percent3', 'winner']
+
+# Opens (and creates if needed) the database
+# WAL and a busy timeout let several writers queue up instead of failing, each batch is its own transaction
+def connect(path=db_path):
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(ledger_schema + results_schema)
+    return conn
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+# Appends scraped rows (dicts from img_helper.process_frames, in csv column order) in one transaction
+def insert_raw_rows(conn, rows, source=source_whitelist):
+    values = []
+    for row in rows:
+        row_values = [None if pd.isna(v) else str(v) for v in list(row.values())[:len(clean.raw_column_names)]]
+        row_values += [None] * (len(clean.raw_column_names) - len(row_values))
+        values.append([source] + row_values)
+    with conn:
+        conn.executemany(
+            f'INSERT INTO raw_votes (source, {", ".join(clean.raw_column_names)}) '
+            f'VALUES ({", ".join("?" * (len(clean.raw_column_names) + 1))})', values)
+    return len(values)
+
+# Raw rows of a source as a dataframe with clean.raw_column_names columns, in insert order
+def read_raw(conn, source=source_whitelist):
+    return pd.read_sql_query(f'SELECT {", ".join(clean.raw_column_names)} FROM raw_votes WHERE source = ? ORDER BY id',
+                             conn, params=(source,))
+
+# Replaces the cleaned rows of a source with df (output of clean.clean_vote_frame)
+def replace_clean(conn, df, source=source_whitelist):
+    out = df[clean_columns].copy()
+    out['created_at'] = out['created_at'].astype(str)
+    out.insert(0, 'source', source)
+    with conn:
+        conn.execute('DELETE FROM clean_votes WHERE source = ?', (source,))
+        conn.executemany(f'INSERT INTO clean_votes (source, {", ".join(clean_columns)}) '
+                         f'VALUES ({", ".join("?" * (len(clean_columns) + 1))})',
+                         out.astype(object).where(out.notna(), None).itertuples(index=False, name=None))
+
+# Cleaned rows as a dataframe, optionally filtered with the indexes by streamer, date range (inclusive, YYYY-MM-DD)
+# and map (in any of the three cards)
+def read_clean(conn, source=source_whitelist, user_name=None, start_date=None, end_date=None, map_name=None):
+    query = f'SELECT {", ".join(clean_columns)} FROM clean_votes WHERE source = ?'
+    params = [source]
+    if user_name is not None:
+        query += ' AND user_name = ?'
+        params.append(user_name)
+    if start_date is not None:
+        query += ' AND created_at >= ?'
+        params.append(str(start_date))
+    if end_date is not None:
+        query += ' AND created_at <= ?'
+        params.append(str(end_date))
+    if map_name is not None:
+        query += ' AND (map1 = ? OR map2 = ? OR map3 = ?)'
+        params += [map_name] * 3
+    return pd.read_sql_query(query + ' ORDER BY id', conn, params=params)
+
+# Replaces the stored map summary of a source with df (output of clean.summarize_vote_data)
+# The table is created by pandas from the summary columns on first write
+def replace_summary(conn, df, source=source_whitelist):
+    with conn:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'map_summary'").fetchone():
+            conn.execute('DELETE FROM map_summary WHERE source = ?', (source,))
+        df.assign(source=source).to_sql('map_summary', conn, if_exists='append', index=False)
+
+def read_summary(conn, source=source_whitelist):
+    return pd.read_sql_query('SELECT * FROM map_summary WHERE source = ?', conn, params=(source,)).drop(columns=['source'])
+
+# Cleans the raw rows of a source into clean_votes and map_summary, returns the cleaned df
+def clean_source(conn, source=source_whitelist):
+    df = clean.clean_vote_frame(read_raw(conn, source))
+    replace_clean(conn, df, source)
+    replace_summary(conn, clean.summarize_vote_data(df), source)
+    return df
+
+def _file_sha1(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+# One time import of an existing raw csv (no header, clean.raw_column_names order)
+# Returns the number of rows imported, 0 if the path was imported before, since app.py keeps appending
+# to the csv the rows it also inserts here
+# Rows of urls the source already has in raw_votes are skipped, app.py inserted those when their scan finished
+def import_raw_csv(conn, path, source=source_whitelist):
+    if not os.path.exists(path):
+        return 0
+    if conn.execute('SELECT 1 FROM imported_files WHERE path = ?', (path,)).fetchone():
+        return 0
+    sha1 = _file_sha1(path)
+    df = pd.read_csv(path, names=clean.raw_column_names, header=None, dtype=str)
+    stored_urls = {url for (url,) in conn.execute('SELECT DISTINCT url FROM raw_votes WHERE source = ?', (source,))}
+    skipped = df['url'].isin(stored_urls)
+    if skipped.any():
+        print(f"Skipping {int(skipped.sum())} row(s) of {path} already in raw_votes")
+    rows = df[~skipped].to_dict('records')
+    count = insert_raw_rows(conn, rows, source)
+    with conn:
+        conn.execute('INSERT INTO imported_files (path, sha1, table_name, rows, imported_at) VALUES (?, ?, ?, ?, ?)',
+                     (path, sha1, 'raw_votes', count, _now()))
+    return count
+
+# Adds or replaces the ledger entry of a VOD, duration None when unknown
+def record_vod(conn, url, user_name, created_at, status, duration, rows_found, scanner_version):
+    if duration is not None and duration == float('inf'):
+        duration = None
+    with conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO processed_vods '
+            '(url, user_name, created_at, status, duration, rows_found, scanner_version, processed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (url, user_name, created_at, status, duration, rows_found, scanner_version, _now()))
+
+# Set of urls with the given status, for constant time membership checks while filtering VOD lists
+# min_version leaves out entries scanned by an older scanner, so they are scanned again
+def processed_urls(conn, status=status_done, min_version=None):
+    query = 'SELECT url, scanner_version FROM processed_vods WHERE status = ?'
+    urls = set()
+    for url, version in conn.execute(query, (status,)):
+        if min_version is not None and (version is None or int(version) < int(min_version)):
+            continue
+        urls.add(url)
+    return urls
+
+# Ledger entry of one url as a dict, None if it was never processed
+def get_vod(conn, url):
+    cursor = conn.execute('SELECT * FROM processed_vods WHERE url = ?', (url,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([column[0] for column in cursor.description], row))
+
+ledger_columns = ['url', 'user_name', 'created_at', 'status', 'duration', 'rows_found', 'scanner_version', 'processed_at']
+
+# Writes the whole ledger to a csv sorted by url, so each run's changes diff and merge as plain lines
+# Returns the number of entries written
+def export_ledger(conn, path=ledger_csv_path):
+    df = pd.read_sql_query(f'SELECT {", ".join(ledger_columns)} FROM processed_vods ORDER BY url', conn)
+    df.to_csv(path, index=False)
+    return len(df)
+
+# Merges a csv written by export_ledger into the ledger, an entry only replaces one processed earlier
+# Returns the number of entries in the csv, 0 if it does not exist
+def import_ledger(conn, path=ledger_csv_path):
+    if not os.path.exists(path):
+        return 0
+    text_columns = [c for c in ledger_columns if c not in ('duration', 'rows_found')]
+    df = pd.read_csv(path, dtype={c: str for c in text_columns}).reindex(columns=ledger_columns)
+    values = [[None if pd.isna(v) else v for v in row] for row in df.itertuples(index=False)]
+    with conn:
+        conn.executemany(
+            f'INSERT INTO processed_vods ({", ".join(ledger_columns)}) '
+            f'VALUES ({", ".join("?" * len(ledger_columns))}) '
+            'ON CONFLICT(url) DO UPDATE SET '
+            + ', '.join(f'{c} = excluded.{c}' for c in ledger_columns[1:])
+            + ' WHERE excluded.processed_at > processed_vods.processed_at', values)
+    return len(values)
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'clean'
+    conn = connect(db_path)
+    if command == 'export-ledger':
+        print(f"Exported {export_ledger(conn)} ledger entries to {ledger_csv_path}")
+    elif command == 'import-ledger':
+        print(f"Read {import_ledger(conn)} ledger entries from {ledger_csv_path}")
+    else:
+        if command == 'import':
+            for path, source in [('vote_data_whitelisted.csv', source_whitelist), ('vote_data_random.csv', source_random)]:
+                print(f"Imported {import_raw_csv(conn, path, source)} raw rows from {path}")
+        for source in [source_whitelist, source_random]:
+            if conn.execute('SELECT 1 FROM raw_votes WHERE source = ? LIMIT 1', (source,)).fetchone():
+                print(f"Cleaned {len(clean_source(conn, source))} {source} rows")
+    conn.close()
@@ -0,0 +1,143 @@
+import os
+import re
+import hashlib
+import cv2
+import numpy as np
+
+# Fast path for the votesN regions, which only ever read "N VOTE(S)" with N from 0 to 10
+# Nearest neighbour on normalized crops against a small labeled set, EasyOCR is only needed when it isn't confident
+# Labeled crops live in templates_votes/<count>/*.png, and can be collected from confident EasyOCR reads while scraping
+
+votes_template_dir = 'templates_votes'
+vote_text_pattern = re.compile(r'^\s*(\d{1,2})\s*VOTES?\b', re.IGNORECASE)
+
+# Vote count from OCR text, same reading as clean.clean_vote_data ("VOTE" alone is 1)
+# Returns None if the text isn't a vote count
+def parse_vote_count(text):
+    if not text:
+        return None
+    if text.strip().upper() == 'VOTE':
+        return 1
+    match = vote_text_pattern.match(text)
+    if not match:
+        return None
+    count = int(match.group(1))
+    return count if count <= 10 else None
+
+# Text the game shows for a vote count
+def vote_count_text(count):
+    return f"{count} VOTE" if count == 1 else f"{count} VOTES"
+
+class VoteCountClassifier:
+    sample_width = 64
+    sample_height = 16
+
+    # Scores are correlations after removing the part every count shares ("VOTES", the card background),
+    # so they measure the digits alone
+    def __init__(self, crops=(), labels=(), min_score=0.6, min_margin=0.15):
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.labels = np.array(labels, dtype=np.int64)
+        self.common = np.zeros(self.sample_width * self.sample_height, dtype=np.float32)
+        if len(crops):
+            vectors = np.stack([self.normalize(crop) for crop in crops])
+            if len(np.unique(self.labels)) > 1:
+                self.common = np.stack([vectors[self.labels == label].mean(axis=0) for label in np.unique(self.labels)]).mean(axis=0)
+            self.vectors = np.stack([self._unit(vector - self.common) for vector in vectors])
+        else:
+            self.vectors = np.zeros((0, self.sample_width * self.sample_height), dtype=np.float32)
+
+    @staticmethod
+    def _unit(vector):
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    # Loads labeled crops from folder/<count>/*.png
+    @classmethod
+    def from_folder(cls, folder=votes_template_dir, **kwargs):
+        crops = []
+        labels = []
+        if os.path.isdir(folder):
+            for label in sorted(os.listdir(folder)):
+                label_dir = os.path.join(folder, label)
+                if not label.isdigit() or not os.path.isdir(label_dir):
+                    continue
+                for fname in sorted(os.listdir(label_dir)):
+                    crop = cv2.imread(os.path.join(label_dir, fname), cv2.IMREAD_GRAYSCALE)
+                    if crop is None:
+                        print(f"Failed to load vote template {label}/{fname}")
+                        continue
+                    crops.append(crop)
+                    labels.append(int(label))
+        return cls(crops, labels, **kwargs)
+
+    # Fixed size, zero mean, unit length vector, so dot products are normalized cross correlation
+    @classmethod
+    def normalize(cls, crop):
+        resized = cv2.resize(crop, (cls.sample_width, cls.sample_height), interpolation=cv2.INTER_AREA).astype(np.float32)
+        return cls._unit(resized.ravel() - resized.mean())
+
+    # Vote count for each raw (not upscaled) grayscale crop, None where the match isn't confident
+    def predict(self, crops):
+        if len(self.vectors) == 0 or len(crops) == 0:
+            return [None] * len(crops)
+        scores = np.stack([self._unit(self.normalize(crop) - self.common) for crop in crops]) @ self.vectors.T
+        counts = []
+        for crop_scores in scores:
+            best = int(np.argmax(crop_scores))
+            label = self.labels[best]
+            others = crop_scores[self.labels != label]
+            runner_up = others.max() if len(others) else -1.0
+            if crop_scores[best] >= self.min_score and crop_scores[best] - runner_up >= self.min_margin:
+                counts.append(int(label))
+            else:
+                counts.append(None)
+        return counts
+
+_classifier = None
+
+# Classifier over templates_votes, loaded once per process
+def get_classifier():
+    global _classifier
+    if _classifier is None:
+        _classifier = VoteCountClassifier.from_folder(votes_template_dir)
+    return _classifier
+
+# Saves a raw crop under folder/<count>/ to grow the labeled set, named by content so duplicates collapse
+def save_labeled_crop(crop, count, folder=votes_template_dir):
+    label_dir = os.path.join(folder, str(count))
+    os.makedirs(label_dir, exist_ok=True)
+    name = hashlib.sha1(np.ascontiguousarray(crop).tobytes()).hexdigest()[:16]
+    cv2.imwrite(os.path.join(label_dir, f"{name}.png"), crop)
+
+# Combines vote counts read from many frames of one vote screen
+# Counts only go up while the screen is shown, so 'max' keeps each card's highest count read at least min_agree times,
+# which catches the last vote (e.g. a 10 that most frames show as 9) without trusting a single misread
+# 'majority' keeps each card's most common count instead
+class VoteConsensus:
+    def __init__(self, mode='max', min_agree=2):
+        self.mode = mode
+        self.min_agree = min_agree
+        self.readings = {}
+        self.frames = 0
+
+    # counts is {label: count or None} for one frame
+    def add(self, counts):
+        self.frames += 1
+        for label, count in counts.items():
+            card = self.readings.setdefault(label, {})
+            if count is not None:
+                card[count] = card.get(count, 0) + 1
+
+    # {label: count or None}
+    def result(self):
+        consensus = {}
+        for label, card in self.readings.items():
+            agreed = [count for count, seen in card.items() if seen >= self.min_agree]
+            if not agreed:
+                consensus[label] = None
+            elif self.mode == 'majority':
+                consensus[label] = max(agreed, key=lambda count: (card[count], count))
+            else:
+                consensus[label] = max(agreed)
+        return consensus
@@ -0,0 +1,213 @@
+import math
+import subprocess
+import numpy as np
+
+import hash_helper as hash_helper
+
+frame_width = 1280
+frame_height = 720
+
+# Fixed size frames from a raw video pipe, read with readinto straight into a buffer allocated once
+# read() returns a view of that buffer, valid until the next read, so callers copy what they keep
+# (or pass out= to fill their own array, e.g. a slot of a batch)
+# Reads block until FFmpeg has written the frame, so the decoder sets the pace and no throttling is needed
+class FrameSource:
+    def __init__(self, stream, frame_shape):
+        self.stream = stream
+        self.frame_shape = tuple(frame_shape)
+        self.frame_size = int(np.prod(self.frame_shape))
+        self.buffer = np.empty(self.frame_shape, dtype=np.uint8)
+
+    # Fills target with the next frame, False at the end of the stream
+    def _fill(self, target):
+        view = memoryview(target).cast('B')
+        filled = 0
+        while filled < self.frame_size:
+            count = self.stream.readinto(view[filled:])
+            if not count:
+                return False
+            filled += count
+        return True
+
+    # Next frame as a uint8 array of frame_shape, None at the end of the stream
+    def read(self, out=None):
+        target = self.buffer if out is None else out
+        return target if self._fill(target) else None
+
+    # Reads past count frames, returns how many were skipped before the stream ended
+    def skip(self, count):
+        for skipped in range(count):
+            if not self._fill(self.buffer):
+                return skipped
+        return count
+
+# FFmpeg filters of a decode at fps, and the (height, width) of the frames they pipe out
+# With crop_vote_area, the vote banner box (hash_helper.vote_area_box at 1280x720) is cropped from the source frame
+# in relative terms and only the banner is scaled to 512x80, the full frame is never scaled to 1280x720
+# Scaling the crop instead of cropping the scaled frame shifts banner hashes by a few bits, thresholds were rechecked
+# with benchmarks/replay.py
+# With hash_size, the banner is also downscaled to pHash input size (hash_size * 4 pixels square)
+def decode_filters(fps, crop_vote_area=False, hash_size=None):
+    if not crop_vote_area:
+        return [f'fps={fps}', f'scale={frame_width}:{frame_height}'], (frame_height, frame_width)
+    left, top, right, bottom = hash_helper.vote_area_box(frame_width, frame_height)
+    filters = [f'fps={fps}',
+               f'crop=iw*{(right - left) / frame_width}:ih*{(bottom - top) / frame_height}'
+               f':iw*{left / frame_width}:ih*{top / frame_height}',
+               f'scale={right - left}:{bottom - top}']
+    if not hash_size:
+        return filters, (bottom - top, right - left)
+    img_size = hash_size * 4
+    return filters + [f'scale={img_size}:{img_size}:flags=lanczos'], (img_size, img_size)
+
+# One FFmpeg decode pipeline kept open for a whole VOD.
+# Frames come out at a fixed rate (the fine rate), coarse sampling is done by dropping frames in Python,
+# and short forward seeks (coarse steps, moving past a fine search window) are served by reading through the pipe.
+# Backwards seeks, or forward seeks longer than max_drop_seconds (the skip past a vote screen), restart FFmpeg
+# with -ss, so the skipped span is never downloaded or decoded.
+# With crop_vote_area, FFmpeg crops to the vote banner before piping (512x80 instead of 1280x720),
+# and with hash_size also downscales the banner to pHash input size, see decode_filters().
+# Full frames for OCR come from grab_frame().
+# With keyframes_only, the decoder skips every non keyframe (-skip_frame nokey), so each output frame
+# repeats the last keyframe before it. Only meant for low rate coarse sampling.
+class DecodeSession:
+    def __init__(self, m3u8_url, fps, start_time=0, max_drop_seconds=60, crop_vote_area=False, hash_size=None,
+                 keyframes_only=False, debug=False):
+        self.m3u8_url = m3u8_url
+        self.fps = fps
+        self.keyframes_only = keyframes_only
+        self.max_drop_seconds = max_drop_seconds
+        self.debug = debug
+        self.filters, self.frame_shape = decode_filters(fps, crop_vote_area, hash_size)
+        self.frame_size = self.frame_shape[0] * self.frame_shape[1]
+        self.proc = None
+        self.source = None
+        self.start_time = 0
+        self.frames_read = 0
+        self.frames_decoded = 0 # frames piped out of FFmpeg over every restart, read or dropped
+        self.returncode = None # exit status of the current FFmpeg process, once its pipe ran dry
+        self.restarts = 0
+        self._open(start_time)
+
+    # Time (seconds into the VOD) of the next frame read() will return
+    @property
+    def position(self):
+        return round(self.start_time + self.frames_read / self.fps, 2)
+
+    # First frame time at or after target_time on this pipe's frame grid, never behind position
+    # Seeking there reads forward, where an off grid time just behind position would restart FFmpeg
+    def next_frame_time(self, target_time):
+        frames = math.ceil(round((target_time - self.start_time) * self.fps, 6))
+        return round(self.start_time + max(frames, self.frames_read) / self.fps, 2)
+
+    def _open(self, start_time):
+        self._close()
+        if self.debug:
+            keyframes = ", keyframes only" if self.keyframes_only else ""
+            print(f"Starting FFmpeg at {start_time:.2f} seconds ({self.fps:.3g} fps, {self.frame_shape[1]}x{self.frame_shape[0]}{keyframes})...")
+        ffmpeg_cmd = ['ffmpeg']
+        if self.keyframes_only:
+            ffmpeg_cmd += ['-skip_frame', 'nokey']
+        ffmpeg_cmd += [
+            '-ss', str(start_time),
+            '-i', self.m3u8_url,
+            '-vf', ', '.join(self.filters),
+            '-f', 'rawvideo',
+            '-pix_fmt', 'gray',
+            '-loglevel', 'error',
+            'pipe:1'
+        ]
+        # Unbuffered, frames are read straight from the pipe into the FrameSource buffer
+        self.proc = subprocess.Popen(ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+        self.source = FrameSource(self.proc.stdout, self.frame_shape)
+        self.start_time = start_time
+        self.frames_read = 0
+        self.returncode = None
+        self.restarts += 1
+
+    # Called when the pipe runs dry, waits for FFmpeg to exit and keeps its status
+    def _ended(self):
+        if self.proc is None or self.returncode is not None:
+            return
+        try:
+            self.returncode = self.proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            pass
+
+    # True once the pipe ran dry and FFmpeg exited with 0, i.e. the stream really ended
+    # False after a failure (unreachable url, network drop mid VOD), which also just ends the pipe
+    @property
+    def completed(self):
+        return self.returncode == 0
+
+    def _close(self):
+        if self.proc is None:
+            return
+        if self.proc.stdout:
+            self.proc.stdout.close()
+        self.proc.terminate()
+        self.proc.wait()
+        self.proc = None
+        self.source = None
+
+    # Returns (time, frame) for the next frame, frame is a uint8 array of frame_shape
+    # The frame is the session's read buffer and is overwritten by the next read, unless out is given to read into
+    # Returns (time, None) at the end of the stream, or when FFmpeg failed, see completed
+    def read(self, out=None):
+        frame_time = self.position
+        frame = self.source.read(out) if self.source else None
+        if frame is None:
+            self._ended()
+            return frame_time, None
+        self.frames_read += 1
+        self.frames_decoded += 1
+        return frame_time, frame
+
+    # Moves the session so the next read() returns the frame at target_time
+    # Returns False if the stream ended while dropping frames
+    def seek(self, target_time):
+        target_time = round(target_time, 2)
+        if target_time < self.position or target_time - self.position > self.max_drop_seconds:
+            self._open(target_time)
+            return True
+        to_drop = 0
+        while round(self.start_time + (self.frames_read + to_drop) / self.fps, 2) < target_time:
+            to_drop += 1
+        dropped = self.source.skip(to_drop) if self.source else 0
+        self.frames_read += dropped
+        self.frames_decoded += dropped
+        if dropped < to_drop:
+            self._ended()
+        return dropped == to_drop
+
+    def close(self):
+        self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# Decodes a single full 1280x720 grayscale frame at frame_time, for OCR once a match is confirmed
+# Returns None if FFmpeg fails or the time is past the end of the stream
+def grab_frame(m3u8_url, frame_time):
+    ffmpeg_cmd = [
+        'ffmpeg',
+        '-ss', str(frame_time),
+        '-i', m3u8_url,
+        '-frames:v', '1',
+        '-vf', f'scale={frame_width}:{frame_height}',
+        '-f', 'rawvideo',
+        '-pix_fmt', 'gray',
+        '-loglevel', 'error',
+        'pipe:1'
+    ]
+    try:
+        result = subprocess.run(ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except Exception as e:
+        print(f"FFmpeg failed: {e}")
+        return None
+    if len(result.stdout) < frame_width * frame_height:
+        return None
+    return np.frombuffer(result.stdout[:frame_width * frame_height], np.uint8).reshape((frame_height, frame_width))
@@ -0,0 +1,122 @@
+import math
+import numpy as np
+import scipy.fftpack
+
+# Vectorized perceptual hashing on numpy frames, no PIL round trip
+# Produces the same bits as imagehash.phash, so hashes can be compared against load_template_hashes() templates
+
+# Pillow's resample uses 8 bit fixed point coefficients with this many fractional bits
+precision_bits = 32 - 8 - 2
+
+# Popcount of every byte value, for hamming distances on packed hashes
+popcount_table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+_weights_cache = {}
+
+def _sinc(x):
+    if x == 0.0:
+        return 1.0
+    x = x * math.pi
+    return math.sin(x) / x
+
+def _lanczos(x):
+    if -3.0 <= x < 3.0:
+        return _sinc(x) * _sinc(x / 3)
+    return 0.0
+
+# Resample weights matching Pillow's precompute_coeffs + normalize_coeffs_8bpc for Image.LANCZOS
+# Returns an (out_size, in_size) float64 matrix of integer fixed point weights
+def lanczos_weights(in_size, out_size):
+    key = (in_size, out_size)
+    if key in _weights_cache:
+        return _weights_cache[key]
+
+    support = 3.0
+    filterscale = scale = in_size / out_size
+    if filterscale < 1.0:
+        filterscale = 1.0
+    support = support * filterscale
+    weights = np.zeros((out_size, in_size), dtype=np.float64)
+    for xx in range(out_size):
+        center = (xx + 0.5) * scale
+        ss = 1.0 / filterscale
+        xmin = max(int(center - support + 0.5), 0)
+        xmax = min(int(center + support + 0.5), in_size) - xmin
+        k = [_lanczos((x + xmin - center + 0.5) * ss) for x in range(xmax)]
+        ww = sum(k)
+        for x in range(xmax):
+            w = k[x] / ww if ww != 0.0 else k[x]
+            if w < 0:
+                weights[xx, xmin + x] = int(-0.5 + w * (1 << precision_bits))
+            else:
+                weights[xx, xmin + x] = int(0.5 + w * (1 << precision_bits))
+
+    _weights_cache[key] = weights
+    return weights
+
+# Rounds and clips a fixed point accumulator back to 8 bit values, like Pillow's clip8
+def _clip8(acc):
+    return np.clip(np.floor((acc + (1 << (precision_bits - 1))) / (1 << precision_bits)), 0, 255)
+
+# Resizes a (n, height, width) uint8 stack to (n, size, size) the way PIL's Image.resize(LANCZOS) does
+# Horizontal pass first, rounded to 8 bits, then the vertical pass
+# Fixed point sums stay well under 2**53, so float64 matmuls are exact
+def resize_stack(stack, size):
+    n, height, width = stack.shape
+    wx = lanczos_weights(width, size)
+    wy = lanczos_weights(height, size)
+    horizontal = _clip8(stack.astype(np.float64) @ wx.T)
+    return _clip8(wy @ horizontal)
+
+# (left, top, right, bottom) of the vote banner, same bounds as img_helper.crop_vote_area
+def vote_area_box(width, height):
+    left = int(0.3 * width)
+    right = int(0.7 * width)
+    top = int(0.14 * height)
+    bottom = int(0.25 * height)
+    return left, top, right, bottom
+
+# Same crop as img_helper.crop_vote_area, on arrays shaped (..., height, width)
+def crop_vote_area_array(frames):
+    height, width = frames.shape[-2:]
+    left, top, right, bottom = vote_area_box(width, height)
+    return frames[..., top:bottom, left:right]
+
+# Packs boolean hash bits (n, bits) into (n, words) uint64, row major like ImageHash.hash.flatten()
+def pack_bits(bits):
+    packed = np.packbits(bits.astype(bool), axis=-1)
+    pad = (-packed.shape[-1]) % 8
+    if pad:
+        packed = np.concatenate([packed, np.zeros(packed.shape[:-1] + (pad,), dtype=np.uint8)], axis=-1)
+    return np.ascontiguousarray(packed).view('>u8').astype(np.uint64)
+
+# pHash of every image in a (n, height, width) uint8 stack with one batched resize and DCT
+# Returns (n, words) packed uint64 hashes, words = hash_size**2 / 64 rounded up
+def phash_stack(stack, hash_size=8, highfreq_factor=4):
+    stack = np.asarray(stack)
+    if stack.ndim == 2:
+        stack = stack[None]
+    img_size = hash_size * highfreq_factor
+    pixels = resize_stack(stack, img_size)
+    dct = scipy.fftpack.dct(scipy.fftpack.dct(pixels, axis=1), axis=2)
+    dctlowfreq = dct[:, :hash_size, :hash_size].reshape(len(stack), -1)
+    med = np.median(dctlowfreq, axis=1, keepdims=True)
+    return pack_bits(dctlowfreq > med)
+
+# Packed (templates, words) matrix from load_template_hashes() output
+def template_matrix(thashes):
+    if not thashes:
+        return np.zeros((0, 1), dtype=np.uint64)
+    return pack_bits(np.stack([thash.hash.flatten() for name, thash in thashes]))
+
+# Hamming distances between every hash and every template, XOR + popcount
+# Returns (n, templates) int array
+def hamming_distances(hashes, templates):
+    xor = np.bitwise_xor(hashes[:, None, :], templates[None, :, :])
+    return popcount_table[xor.view(np.uint8)].reshape(xor.shape[0], xor.shape[1], -1).sum(axis=2, dtype=np.int64)
+
+# Smallest distance to any template for each hash
+def min_distances(hashes, templates):
+    if len(templates) == 0:
+        return np.full(len(hashes), np.iinfo(np.int64).max)
+    return hamming_distances(hashes, templates).min(axis=1)
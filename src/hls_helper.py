@@ -0,0 +1,273 @@
+import os
+import re
+import sys
+import time
+import base64
+import hashlib
+import threading
+import posixpath
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urljoin, urlsplit
+import requests
+
+# Local read through cache for HLS VODs, so FFmpeg restarts, fine pass rewinds and rescans read segments from disk
+# HlsProxy serves VOD playlists on localhost with every segment uri pointing back at itself, FFmpeg is given
+# proxy.url_for(m3u8_url) instead of the m3u8 url and needs no other change
+# Segments (and finished playlists) are kept in segment_cache/ under a disk budget, least recently used evicted first
+# offline=True serves only what is already cached, for replaying a VOD without network
+# Fill the cache ahead of time with: python src/hls_helper.py <m3u8 url> [cache folder] [rendition]
+
+segment_cache_dir = 'segment_cache'
+segment_cache_gb = 20
+
+class SegmentCache:
+    def __init__(self, folder=segment_cache_dir, max_bytes=segment_cache_gb * 1024 ** 3):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # file name: size, least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        # Recency survives restarts through the files' mtimes
+        files = [e for e in os.scandir(folder) if e.is_file() and not e.name.endswith('.tmp')]
+        for entry in sorted(files, key=lambda e: e.stat().st_mtime):
+            self.entries[entry.name] = entry.stat().st_size
+            self.total_bytes += entry.stat().st_size
+
+    def _name(self, url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    # Cached bytes of url, None on a miss
+    def get(self, url):
+        name = self._name(url)
+        with self.lock:
+            if name not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(name)
+            self.hits += 1
+        path = os.path.join(self.folder, name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            with self.lock:
+                self.total_bytes -= self.entries.pop(name, 0)
+            return None
+
+    # Stores data for url, evicting least recently used entries until it fits the budget
+    # Anything larger than the whole budget is not stored
+    def put(self, url, data):
+        if len(data) > self.max_bytes:
+            return
+        name = self._name(url)
+        path = os.path.join(self.folder, name)
+        # Written to a temporary file first, so a crash mid write never leaves a truncated segment
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        with self.lock:
+            os.replace(tmp_path, path)
+            self.total_bytes += len(data) - self.entries.pop(name, 0)
+            self.entries[name] = len(data)
+            while self.total_bytes > self.max_bytes:
+                evicted, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                try:
+                    os.remove(os.path.join(self.folder, evicted))
+                except OSError:
+                    pass
+
+def _encode(url):
+    return base64.urlsafe_b64encode(url.encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode(token):
+    return base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('utf-8')
+
+uri_attribute = re.compile(r'URI="([^"]+)"')
+tag_attribute = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+# Attributes of a playlist tag line like #EXT-X-STREAM-INF:BANDWIDTH=...,RESOLUTION=..., quotes removed
+def tag_attributes(line):
+    return {name: value.strip('"') for name, value in tag_attribute.findall(line.partition(':')[2])}
+
+# (tag line or None, uri) of every uri in a playlist, segment and playlist lines, and URI="..." attributes
+def playlist_uris(text):
+    uris = []
+    for line in text.splitlines():
+        if line.startswith('#'):
+            uris += [(line, uri) for uri in uri_attribute.findall(line)]
+        elif line.strip():
+            uris.append((None, line.strip()))
+    return uris
+
+# (attributes, uri) of each variant of a master playlist, empty for a media playlist
+def variants(text):
+    found = []
+    attributes = None
+    for line in text.splitlines():
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            attributes = tag_attributes(line)
+        elif attributes is not None and line.strip() and not line.startswith('#'):
+            found.append((attributes, line.strip()))
+            attributes = None
+    return found
+
+# Variant whose VIDEO group (Twitch's '1080p60', 'chunked'...), RESOLUTION or file name is rendition,
+# the highest BANDWIDTH one when rendition is None, like streamlink's 'best' and FFmpeg's default stream
+def choose_variant(found, rendition=None):
+    if rendition is None:
+        return max(found, key=lambda v: int(v[0].get('BANDWIDTH', 0)))
+    for attributes, uri in found:
+        name = posixpath.splitext(posixpath.basename(urlsplit(uri).path))[0]
+        if rendition in (attributes.get('VIDEO'), attributes.get('RESOLUTION'), name):
+            return attributes, uri
+    available = ', '.join(v[0].get('VIDEO') or v[0].get('RESOLUTION') or v[1] for v in found)
+    raise ValueError(f"No {rendition} rendition, the playlist has {available}")
+
+class HlsProxy:
+    def __init__(self, cache, offline=False, timeout=30):
+        self.cache = cache
+        self.offline = offline
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.origin_requests = 0
+        self.origin_bytes = 0
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status, body, content_type = proxy.handle(self.path)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass # FFmpeg was stopped mid segment, on a seek or at the end of a scan
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    # Playlist url to give FFmpeg in place of m3u8_url
+    def url_for(self, m3u8_url):
+        return f'{self.base_url}/p/{_encode(m3u8_url)}/index.m3u8'
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.session.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    # Bytes of url from the cache, or from the network (then cached if cacheable(data)), None if unavailable
+    def fetch(self, url, cacheable=None):
+        data = self.cache.get(url)
+        if data is not None or self.offline:
+            return data
+        try:
+            r = self.session.get(url, timeout=self.timeout)
+            r.raise_for_status()
+        except requests.RequestException as e:
+            print(f"Segment cache could not fetch {url}: {e}")
+            return None
+        data = r.content
+        self.origin_requests += 1
+        self.origin_bytes += len(data)
+        if cacheable is None or cacheable(data):
+            self.cache.put(url, data)
+        return data
+
+    # Playlist with every uri resolved against playlist_url and pointed at this proxy
+    def rewrite_playlist(self, playlist_url, text):
+        def proxied(uri):
+            absolute = urljoin(playlist_url, uri)
+            name = posixpath.basename(urlsplit(absolute).path) or 'segment'
+            kind = 'p' if name.endswith('.m3u8') else 's'
+            return f'{self.base_url}/{kind}/{_encode(absolute)}/{name}'
+        lines = []
+        for line in text.splitlines():
+            if line.startswith('#'):
+                line = uri_attribute.sub(lambda m: f'URI="{proxied(m.group(1))}"', line)
+            elif line.strip():
+                line = proxied(line.strip())
+            lines.append(line)
+        return '\n'.join(lines) + '\n'
+
+    # (status, body, content type) of a GET /p/<url>/<name> (playlist) or /s/<url>/<name> (segment)
+    def handle(self, path):
+        parts = path.split('/')
+        if len(parts) < 4 or parts[1] not in ('p', 's'):
+            return 404, b'', 'text/plain'
+        try:
+            url = _decode(parts[2])
+        except ValueError:
+            return 404, b'', 'text/plain'
+        if parts[1] == 'p':
+            # Finished VOD playlists and master playlists never change, live ones are fetched again each time
+            data = self.fetch(url, cacheable=lambda data: b'#EXT-X-ENDLIST' in data or b'#EXT-X-STREAM-INF' in data)
+            if data is None:
+                return 404 if self.offline else 502, b'', 'text/plain'
+            body = self.rewrite_playlist(url, data.decode('utf-8', errors='replace')).encode('utf-8')
+            return 200, body, 'application/vnd.apple.mpegurl'
+        data = self.fetch(url)
+        if data is None:
+            return 404 if self.offline else 502, b'', 'text/plain'
+        return 200, data, 'video/mp2t'
+
+    # Caches the playlist at m3u8_url and all of its segments, for offline replay later,
+    # returns the number of segments now in the cache
+    # Of a master playlist, only one variant's segments are cached (choose_variant(rendition), with its audio group),
+    # the other variants' playlists are cached without their segments so FFmpeg can still open the master offline
+    # A url resolved by stream_helper is already a single rendition's playlist
+    def download(self, m3u8_url, rendition=None):
+        status, body, _ = self.handle(urlsplit(self.url_for(m3u8_url)).path)
+        if status != 200:
+            return 0
+        text = body.decode('utf-8')
+        found = variants(text)
+        chosen = choose_variant(found, rendition) if found else None
+        count = 0
+        for tag, uri in playlist_uris(text):
+            path = urlsplit(uri).path
+            if not path.startswith('/p/'):
+                count += self.handle(path)[0] == 200
+            elif chosen is None or uri == chosen[1] or (
+                    tag and tag.startswith('#EXT-X-MEDIA:') and chosen[0].get('AUDIO')
+                    and tag_attributes(tag).get('GROUP-ID') == chosen[0]['AUDIO']):
+                count += self.download(_decode(path.split('/')[2]))
+            else:
+                self.handle(path)
+        return count
+
+if __name__ == "__main__":
+    folder = sys.argv[2] if len(sys.argv) > 2 else segment_cache_dir
+    rendition = sys.argv[3] if len(sys.argv) > 3 else None
+    start = time.time()
+    with HlsProxy(SegmentCache(folder)) as proxy:
+        count = proxy.download(sys.argv[1], rendition)
+    print(f"{count} segments cached in {folder} ({proxy.origin_bytes / 1024 ** 2:.0f} MB downloaded) in {time.time() - start:.0f}s")
@@ -4,10 +4,18 @@ import cv2
 import numpy as np
 from PIL import Image
 import imagehash
-import easyocr
-import gc
 import time
 
+import ffmpeg_helper as ffmpeg_helper
+import hash_helper as hash_helper
+import ocr_helper as ocr_helper
+import digit_helper as digit_helper
+import title_helper as title_helper
+import clean as clean
+
+# Recorded in the processed VOD ledger, bump when a change would find different rows on a VOD scanned before
+scanner_version = '1'
+
 def get_m3u8_url(vod_url):
     try:
         result = subprocess.run(
@@ -63,30 +71,95 @@ def preprocess_for_easyocr(img):
 
 
 # OCR
-def ocr_on_frame(pil_image, regions, reader, user_name, url, created_at, output_dir, debug=False):
-    #image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-    image = np.array(pil_image)
-    #height, width = image.shape[:2]
-    height, width = image.shape
-    row_data = {
-        'user_name': user_name,
-        'vod_url': url,
-        'created_at': created_at
-    }
-    for label, (ry1, ry2, rx1, rx2) in regions.items():
-        y1 = int(ry1 * height)
-        y2 = int(ry2 * height)
-        x1 = int(rx1 * width)
-        x2 = int(rx2 * width)
-        cropped = image[y1:y2, x1:x2]
+# reader is an easyocr.Reader or an ocr_helper.OcrClient
+def ocr_on_frame(pil_image, regions, reader, user_name, url, created_at, output_dir, debug=False, fast_votes=True, collect_dir=None,
+                 fast_maps=True, collect_maps_dir=None):
+    return ocr_on_frames([pil_image], regions, reader, user_name, url, created_at, output_dir, debug, fast_votes, collect_dir,
+                         fast_maps, collect_maps_dir)[0]
+
+# OCR on every region of several frames with one batched recognizer call
+# With fast_votes, votesN regions are read by digit_helper's classifier first, and only go to EasyOCR when it isn't confident
+# With collect_dir, vote crops EasyOCR read as a clean count are saved there as labeled examples for the classifier
+# With fast_maps, mapN regions are looked up in title_helper's map title index first, the same way
+# With collect_maps_dir, map crops whose EasyOCR text closely matches a known map are saved there for title_helper.build_index
+# Returns one row_data dict per frame
+def ocr_on_frames(pil_images, regions, reader, user_name, url, created_at, output_dir, debug=False, fast_votes=True, collect_dir=None,
+                  fast_maps=True, collect_maps_dir=None):
+    raw_crops = []
+    for pil_image in pil_images:
+        #image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+        image = np.array(pil_image)
+        #height, width = image.shape[:2]
+        height, width = image.shape
+        for label, (ry1, ry2, rx1, rx2) in regions.items():
+            y1 = int(ry1 * height)
+            y2 = int(ry2 * height)
+            x1 = int(rx1 * width)
+            x2 = int(rx2 * width)
+            raw_crops.append((label, image[y1:y2, x1:x2]))
+
+    # Vote counts from the fast classifier
+    texts = [None] * len(raw_crops)
+    if fast_votes:
+        vote_indices = [i for i, (label, _) in enumerate(raw_crops) if label.startswith('votes')]
+        counts = digit_helper.get_classifier().predict([raw_crops[i][1] for i in vote_indices])
+        for i, count in zip(vote_indices, counts):
+            if count is not None:
+                texts[i] = digit_helper.vote_count_text(count)
+
+    # Map names from the title hash index
+    if fast_maps:
+        map_indices = [i for i, (label, _) in enumerate(raw_crops) if label.startswith('map')]
+        names = title_helper.get_index().lookup([raw_crops[i][1] for i in map_indices])
+        for i, name in zip(map_indices, names):
+            if name is not None:
+                texts[i] = name
+
+    # Everything else through EasyOCR
+    ocr_indices = [i for i, text in enumerate(texts) if text is None]
+    crops = []
+    for i in ocr_indices:
+        label, cropped = raw_crops[i]
         processed = preprocess_for_easyocr(cropped)
         if debug:
             path = os.path.join(output_dir, f"{label}.png")
             cv2.imwrite(path, processed) # save image for debugging
-        result = reader.readtext(processed, detail=0, paragraph=False)
-        row_data[label] = result[0].strip() if result else '' # type: ignore
+        crops.append(processed)
+    for i, text in zip(ocr_indices, ocr_helper.read_crops(reader, crops)):
+        texts[i] = text
+        label, cropped = raw_crops[i]
+        count = digit_helper.parse_vote_count(text) if label.startswith('votes') else None
+        if collect_dir and count is not None:
+            digit_helper.save_labeled_crop(cropped, count, collect_dir)
+        if collect_maps_dir and label.startswith('map') and text:
+            map_name = clean.fix_map_name(text.upper(), clean.overwatch_maps, threshold=90)
+            if map_name:
+                title_helper.save_labeled_crop(cropped, map_name, collect_maps_dir)
+
+    rows = []
+    for i in range(len(pil_images)):
+        row_data = {
+            'user_name': user_name,
+            'vod_url': url,
+            'created_at': created_at
+        }
+        frame_texts = texts[i * len(regions):(i + 1) * len(regions)]
+        for label, text in zip(regions.keys(), frame_texts):
+            row_data[label] = text
+        rows.append(row_data)
     
-    return row_data
+    return rows
+
+# Vote counts of one frame from the fast classifier alone, {votesN label: count or None}
+def read_vote_counts(pil_image, regions):
+    image = np.array(pil_image)
+    height, width = image.shape
+    labels = [label for label in regions if label.startswith('votes')]
+    crops = []
+    for label in labels:
+        ry1, ry2, rx1, rx2 = regions[label]
+        crops.append(image[int(ry1 * height):int(ry2 * height), int(rx1 * width):int(rx2 * width)])
+    return dict(zip(labels, digit_helper.get_classifier().predict(crops)))
 
 def get_vod_duration(m3u8_url):
     try:
@@ -103,228 +176,325 @@ def get_vod_duration(m3u8_url):
         print(f"Error retrieving VOD duration: {e}")
         return float('inf')  # Fallback to very high limit
 
+# pHash distance (out of 64 bits) for a frame to match a coarse template, and for a fine match
+# Module level so benchmarks/replay.py can sweep them
+coarse_hash_threshold = 15
+fine_hash_threshold = 10
+
+_consensus_warned = False
+
+# The vote consensus reads counts with digit_helper's classifier alone, with no labeled crops in templates_votes
+# every count is None, so the consensus (and its extra decode of each matched span) is skipped, with a warning once
+def consensus_available():
+    global _consensus_warned
+    if len(digit_helper.get_classifier().vectors):
+        return True
+    if not _consensus_warned:
+        print(f"No labeled vote crops in {digit_helper.votes_template_dir}, vote consensus is skipped "
+              "(collect some with --collect-vote-crops).")
+        _consensus_warned = True
+    return False
+
+# Work and time counters of one process_frames scan, for benchmarks/replay.py
+# events holds (time, row) for each vote screen found, time being the best fine match's time in the VOD
+class ScanStats:
+    def __init__(self):
+        self.frames_decoded = 0
+        self.ffmpeg_starts = 0
+        self.hash_seconds = 0.0
+        self.ocr_seconds = 0.0
+        self.events = []
+        self.finished = False # set when the scan reaches the end of the VOD, with or without a checkpoint
+
+# Keeps the best k fine matches by (distance, -index) in storage allocated once per VOD
+# Frames are copied into fixed slots, so memory stays flat however many frames fall under the threshold
+class FineMatchBuffer:
+    def __init__(self, k, frame_shape=None):
+        self.k = k
+        self.entries = [None] * k # (distance, -index, index, time)
+        self.frames = np.empty((k,) + tuple(frame_shape), dtype=np.uint8) if frame_shape else None
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.entries = [None] * self.k
+        self.count = 0
+
+    # Offers a match, kept only if it beats the worst one held once the buffer is full
+    def push(self, index, distance, frame_time, frame=None):
+        key = (distance, -index)
+        if self.count < self.k:
+            slot = self.count
+            self.count += 1
+        else:
+            slot = max(range(self.k), key=lambda i: self.entries[i][:2])
+            if key >= self.entries[slot][:2]:
+                return False
+        self.entries[slot] = (distance, -index, index, frame_time)
+        if self.frames is not None and frame is not None:
+            self.frames[slot] = frame
+        return True
+
+    # (index, distance, time, frame) of the best match, frame is None without frame storage
+    def best(self):
+        slot = min(range(self.count), key=lambda i: self.entries[i][:2])
+        distance, _, index, frame_time = self.entries[slot]
+        frame = self.frames[slot] if self.frames is not None else None
+        return index, distance, frame_time, frame
+
 # Find all frames that have map vote data, and perform ocr
 # Returns list of row data from vod info and OCR
-def process_frames(m3u8_url, thashes_fine, thashes_coarse, output_dir, user_name, url, created_at, regions, debug=False):
-    reader = easyocr.Reader(['en'])
+# reader defaults to this process's shared EasyOCR model, pass an OcrClient to use a shared OcrService instead
+# crop_at_decode has FFmpeg pipe only the vote banner, the full frame is decoded again only for OCR on the best match
+# downscale_at_decode also has FFmpeg shrink the banner to pHash input size (FFmpeg's lanczos, so bits can differ slightly)
+# keyframes_only decodes only keyframes during the coarse pass, each fine search then rewinds to coarse_match_time in a full decode pipe
+# fast_votes, collect_dir, fast_maps and collect_maps_dir are passed on to ocr_on_frames
+# vote_consensus ('max' or 'majority') reads vote counts on every fine match with the fast classifier and combines them
+# with digit_helper.VoteConsensus, instead of taking the counts of the single best frame
+# fine_keep is how many of the best fine matches are held in memory
+# checkpoint (a checkpoint_helper.VodCheckpoint) resumes from its saved position and rows, is saved as the scan goes,
+# and has finished set once the scan reaches its end
+# vod_duration in seconds, looked up with ffprobe when not given, inf when a lookup already failed
+# stats (a ScanStats) is filled in with the scan's frame count, hash and OCR time and found events
+def process_frames(m3u8_url, thashes_fine, thashes_coarse, output_dir, user_name, url, created_at, regions, debug=False, reader=None,
+                   crop_at_decode=True, downscale_at_decode=False, keyframes_only=False, fast_votes=True, collect_dir=None,
+                   fast_maps=True, collect_maps_dir=None, vote_consensus=None, fine_keep=3, checkpoint=None, vod_duration=None,
+                   stats=None):
+    if reader is None:
+        reader = ocr_helper.get_reader()
     
     skip_seconds_on_match = 60 * 13
-    coarse_hash_threshold = 15
-    fine_hash_threshold = 10 
     default_frame_interval = 13
     fine_grained_frame_interval = .1 
     frames_to_fine_grain_search = 25 / fine_grained_frame_interval # Map voting phase was at 20s, now 15
+    fine_batch_size = 25 # Fine mode frames hashed together in one batch
     
     current_time = 0
-    in_fine_mode = False
-    fine_grained_frames_remaining = frames_to_fine_grain_search
-    coarse_match_time = 0  # Time to rewind to for fine-grained search
     found_rows = []
     one_coarse_match_found = False
-    vod_duration = get_vod_duration(m3u8_url)
+    if vote_consensus and not consensus_available():
+        vote_consensus = None
+    if vod_duration is None:
+        vod_duration = get_vod_duration(m3u8_url)
     real_time_start = time.time()
+    if checkpoint and checkpoint.resumed:
+        current_time = checkpoint.current_time
+        found_rows = list(checkpoint.rows)
+        one_coarse_match_found = checkpoint.one_coarse_match_found
+        print(f"Resuming {url} at {current_time:.2f} seconds with {len(found_rows)} row(s) found.")
 
-    # Looping through different pipes
-    while True:
-        effective_interval = fine_grained_frame_interval if in_fine_mode else default_frame_interval
-        search_duration = frames_to_fine_grain_search * fine_grained_frame_interval if in_fine_mode else 0
-        start_time = coarse_match_time if in_fine_mode else current_time
+    # Packed template hashes, compared against frame hashes with a vectorized XOR + popcount
+    tmatrix_fine = hash_helper.template_matrix(thashes_fine)
+    tmatrix_coarse = hash_helper.template_matrix(thashes_coarse)
 
-        if debug:
-            print(f"Starting FFmpeg at {start_time:.2f} seconds (interval = {effective_interval}s)...")
-
-        # ffmpeg_cmd = [
-        #     'ffmpeg',
-        #     '-ss', str(start_time),
-        #     '-i', m3u8_url,
-        #     '-vf', f'fps=1/{effective_interval}',
-        #     '-vcodec', 'png',
-        #     '-f', 'image2pipe',
-        #     '-loglevel', 'error',
-        #     'pipe:1'
-        # ]
-        
-        ffmpeg_cmd = [
-            'ffmpeg',
-            '-ss', str(start_time),
-            '-i', m3u8_url,
-            '-vf', f'fps=1/{effective_interval}, scale=1280:720',
-            '-f', 'rawvideo',
-            '-pix_fmt', 'gray', # 'rgb24' for RGB
-            '-loglevel', 'error',
-            'pipe:1'
-        ]
-        
-        frame_width = 1280
-        frame_height = 720
-        frame_size = frame_width * frame_height # * 3 if RGB
+    # One FFmpeg pipe for the whole VOD, decoding at the fine rate
+    # Coarse mode drops the frames between samples in place instead of restarting FFmpeg
+    # With keyframes_only the coarse pipe runs at the coarse rate on keyframes alone, and stays open across fine searches
+    session_options = dict(crop_vote_area=crop_at_decode, hash_size=8 if downscale_at_decode else None, debug=debug)
+    if keyframes_only:
+        session = ffmpeg_helper.DecodeSession(m3u8_url, 1 / default_frame_interval, start_time=current_time, keyframes_only=True,
+                                              **session_options)
+    else:
+        session = ffmpeg_helper.DecodeSession(m3u8_url, 1 / fine_grained_frame_interval, start_time=current_time, **session_options)
+    ffmpeg_starts = 0
+    frames_decoded = 0 # by sessions already closed
 
-        try:
-            proc = subprocess.Popen(ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        except Exception as e:
-            print(f"FFmpeg failed: {e}")
+    # Fine batches are read straight into this array, one slot per frame
+    batch_frames = np.empty((fine_batch_size,) + session.frame_shape, dtype=np.uint8)
 
-        try:
-            fine_matches = []
-
-            # Looping through pipe
-            while True:
-                # small throttle
-                time.sleep(0.01)
-                
-                if not proc.stdout:
-                    break
-
-                # # Read png
-                # png_header = proc.stdout.read(8)
-                # if not png_header:
-                #     raise EOFError
-                # if png_header != b'\x89PNG\r\n\x1a\n':
-                #     continue
-                # png_data = bytearray(png_header)
-                # while True:
-                #     chunk_len = int.from_bytes(proc.stdout.read(4), 'big')
-                #     chunk_type = proc.stdout.read(4)
-                #     chunk_data = proc.stdout.read(chunk_len)
-                #     crc = proc.stdout.read(4)
-                #     png_data += chunk_len.to_bytes(4, 'big') + chunk_type + chunk_data + crc
-                #     if chunk_type == b'IEND':
-                #         break
-
-                # frame = Image.open(BytesIO(png_data)).convert('RGB')
-                
-                raw_frame = proc.stdout.read(frame_size)
-                if not raw_frame:
-                    raise EOFError
-                frame_array = np.frombuffer(raw_frame, np.uint8).reshape((frame_height, frame_width)) # add , 3 after frame_width for RGB
-                frame = Image.fromarray(frame_array, mode='L')  # 'L' for grayscale, delete for RGB
-                
-                frame_hash = imagehash.phash(crop_vote_area(frame))
-                matched = False
-
-                # # Check frame against template hash
-                # for name, thash in template_hashes:
-                #     distance = thash - frame_hash
-                #     if in_fine_mode:
-                #         if distance <= fine_hash_threshold:
-                #             fine_matches.append((fine_grained_frames_remaining, distance, frame.copy()))
-                #             break
-                #     else:
-                #         if distance <= coarse_hash_threshold:
-                #             matched = True
-                #             break
-                
-                # Check frame against template hashes depending on mode
-                if in_fine_mode:
-                    for name, thash in thashes_fine:
-                        distance = thash - frame_hash
-                        if distance <= fine_hash_threshold:
-                            fine_matches.append((fine_grained_frames_remaining, distance, frame.copy()))
-                            matched = True
-                            break
-                else:
-                    for name, thash in thashes_coarse:
-                        distance = thash - frame_hash
-                        if distance <= coarse_hash_threshold:
-                            matched = True
-                            one_coarse_match_found = True
-                            break
+    # Best fine matches of the current window, banner crops are no use for OCR so only full frames are stored
+    fine_matches = FineMatchBuffer(fine_keep, None if crop_at_decode else (ffmpeg_helper.frame_height, ffmpeg_helper.frame_width))
+    matched_times = set()
 
-                # Move time, handle matches
-                if in_fine_mode:
-                    fine_grained_frames_remaining -= 1
-                    if fine_grained_frames_remaining <= 0:
-                        if fine_matches:
-                            best = sorted(fine_matches, key=lambda x: (x[1], -x[0]))[0]  # (index, distance, frame)
-                            if debug:
-                                print(f"Best fine-grained match found: frame {best[0]} with distance {best[1]}")
-                                match_path = os.path.join(output_dir, f"match.png")
-                                best[2].save(match_path)
-                            # TODO run OCR on all fine_matches? get best text, highest number of total votes?
-                            row = ocr_on_frame(best[2], regions, reader, user_name, url, created_at, output_dir, debug)
-                            for v in row.values(): print(v, end=' - ')
-                            print()
-                            found_rows.append(row)
-                            current_time = coarse_match_time + best[0] * fine_grained_frame_interval + skip_seconds_on_match
-                            del best
-                            del row
-                            gc.collect()
-                        else:
-                            if debug:
-                                print("No fine-grained matches found within threshold.")
-                            current_time = coarse_match_time + search_duration  # move past fine search window
-                        in_fine_mode = False
-                        proc.terminate()
-                        if frame:
-                            frame.close()
-                            del frame
-                        if frame_hash:
-                            del frame_hash
-                        break
+    # Frames from a cropping session are already the vote banner
+    def hash_frames(stack):
+        start = time.perf_counter()
+        if crop_at_decode:
+            hashes = hash_helper.phash_stack(stack)
+        else:
+            hashes = hash_helper.phash_stack(hash_helper.crop_vote_area_array(stack))
+        if stats:
+            stats.hash_seconds += time.perf_counter() - start
+        return hashes
+
+    # Vote counts for the consensus, timed as OCR
+    def consensus_counts(frame):
+        start = time.perf_counter()
+        counts = read_vote_counts(frame, regions)
+        if stats:
+            stats.ocr_seconds += time.perf_counter() - start
+        return counts
+
+    # The pipe ran dry: the end of the VOD when FFmpeg exited cleanly or the scan got to vod_duration,
+    # otherwise FFmpeg failed (bad url, network drop) and the scan stays unfinished so its checkpoint resumes it
+    def stream_ended(s):
+        if s.completed or s.position >= vod_duration - default_frame_interval:
+            return EOFError()
+        return RuntimeError(f"FFmpeg stopped with status {s.returncode} at {s.position:.2f} seconds, scan left unfinished")
+
+    try:
+        # Looping through coarse samples
+        while True:
+            if not session.seek(current_time):
+                raise stream_ended(session)
+            frame_time, frame_array = session.read()
+            if frame_array is None:
+                raise stream_ended(session)
+
+            frame_hash = hash_frames(frame_array)
+            matched = hash_helper.min_distances(frame_hash, tmatrix_coarse)[0] <= coarse_hash_threshold
+            current_time += default_frame_interval
+
+            if matched:
+                if debug:
+                    print("Coarse match found. Entering fine-grained search.")
+                one_coarse_match_found = True
+                coarse_match_time = frame_time  # fine search starts at the matched frame
+                fine_matches.clear()
+                matched_times.clear()
+                fine_grained_frames_remaining = frames_to_fine_grain_search
+                end_of_stream = False
+                consensus = digit_helper.VoteConsensus(vote_consensus) if vote_consensus else None
+                if keyframes_only:
+                    # Rewind to the matched sample in a full decode pipe to recover exact timing
+                    fine_session = ffmpeg_helper.DecodeSession(m3u8_url, 1 / fine_grained_frame_interval,
+                                                               start_time=coarse_match_time, **session_options)
+                    batch_times = []
                 else:
-                    current_time += effective_interval
-                    if matched:
-                        if debug:
-                            print("Coarse match found. Entering fine-grained search.")
-                        in_fine_mode = True
-                        fine_grained_frames_remaining = frames_to_fine_grain_search
-                        coarse_match_time = current_time - effective_interval  # rewind to start of matched frame
-                        proc.terminate()
-                        if frame:
-                            frame.close()
-                            del frame
-                        if frame_hash:
-                            del frame_hash
+                    # The coarse frame is the session's read buffer, move it into the batch before reading on
+                    fine_session = session
+                    batch_frames[0] = frame_array
+                    batch_times = [frame_time]
+
+                # Fine search reads every frame in place, hashing fine_batch_size frames at a time
+                while fine_grained_frames_remaining > 0 and not end_of_stream:
+                    while len(batch_times) < min(fine_batch_size, fine_grained_frames_remaining):
+                        next_time, next_frame = fine_session.read(out=batch_frames[len(batch_times)])
+                        if next_frame is None:
+                            end_of_stream = True
+                            break
+                        batch_times.append(next_time)
+                    if not batch_times:
                         break
 
-                # Free memory for each frame
-                if frame:
-                    frame.close()
-                    del frame
-                if frame_hash: del frame_hash
-                if frame_array.any(): del frame_array
-                if raw_frame: del raw_frame
-                
-                # Break loop after 90 minutes if no coarse match found
-                if not one_coarse_match_found and current_time >= 5400:
-                    if debug:
-                        print("Reached 90-minute no-match time limit. Exiting.")
-                    raise EOFError
-                
-                # Break loop if after vod_duration (catch skipping past vod end)
-                if current_time >= vod_duration:
-                    if debug:
-                        print("Reached or passed end of VOD. Exiting.")
-                    raise EOFError
+                    stack = batch_frames[:len(batch_times)]
+                    distances = hash_helper.min_distances(hash_frames(stack), tmatrix_fine)
+                    for time_of_frame, frame, distance in zip(batch_times, stack, distances):
+                        if distance <= fine_hash_threshold:
+                            fine_matches.push(fine_grained_frames_remaining, int(distance), time_of_frame, frame)
+                            matched_times.add(round(time_of_frame, 2))
+                            if consensus and not crop_at_decode:
+                                consensus.add(consensus_counts(frame))
+                        fine_grained_frames_remaining -= 1
+                    batch_times = []
+                if fine_session is not session:
+                    ffmpeg_starts += fine_session.restarts
+                    frames_decoded += fine_session.frames_decoded
+                    fine_session.close()
+                    end_of_stream = False  # the coarse pipe carries on
+
+                # Banner only pipes have no vote counts, decode the matched span again in full for the consensus
+                if consensus and crop_at_decode and fine_matches:
+                    with ffmpeg_helper.DecodeSession(m3u8_url, 1 / fine_grained_frame_interval, start_time=min(matched_times)) as span:
+                        while span.position <= max(matched_times):
+                            time_of_frame, frame = span.read()
+                            if frame is None:
+                                break
+                            if time_of_frame in matched_times:
+                                consensus.add(consensus_counts(frame))
+                        ffmpeg_starts += span.restarts
+                        frames_decoded += span.frames_decoded
 
-                # Break loop after 12 hours
-                if current_time >= 43200:
+                search_duration = frames_to_fine_grain_search * fine_grained_frame_interval
+                best_frame = None
+                if fine_matches:
+                    best = fine_matches.best()  # (index, distance, time, frame)
+                    best_frame = best[3]
+                    if best_frame is None:
+                        # One more FFmpeg process, counted with the session restarts
+                        best_frame = ffmpeg_helper.grab_frame(m3u8_url, best[2])
+                        ffmpeg_starts += 1
+                        frames_decoded += best_frame is not None
+                    if best_frame is None:
+                        print(f"Failed to decode full frame at {best[2]:.2f} seconds.")
+                if best_frame is not None:
                     if debug:
-                        print("Reached 12hr time limit. Exiting.")
-                    raise EOFError
-
-                # Print every 5 minutes in hours:minutes format
-                current_time = round(current_time, 2)
-                if debug and current_time % 300 < effective_interval:
-                    real_current_time = time.time()
-                    real_elapsed_time = real_current_time - real_time_start
-                    real_time_start = real_current_time
-                    hours = int(current_time // 3600)
-                    minutes = int((current_time % 3600) // 60)
-                    print(f"Vod Progress: {hours:02d}:{minutes:02d}\t Step Took: {real_elapsed_time:.2f}s")
-
-        except EOFError:
-            if debug:
-                print("Reached end of stream.")
-            break
-        except Exception as e:
-            print(f"Error: {e}")
-            break
-        finally:
-            gc.collect()
-            if proc.stdout:
-                proc.stdout.close()
-            proc.terminate()
-            proc.wait()
+                        print(f"Best fine-grained match found: frame {best[0]} with distance {best[1]}")
+                        match_path = os.path.join(output_dir, f"match.png")
+                        cv2.imwrite(match_path, best_frame)
+                    ocr_start = time.perf_counter()
+                    row = ocr_on_frame(best_frame, regions, reader, user_name, url, created_at, output_dir, debug,
+                                       fast_votes, collect_dir, fast_maps, collect_maps_dir)
+                    if stats:
+                        stats.ocr_seconds += time.perf_counter() - ocr_start
+                        stats.events.append((round(best[2], 2), row))
+                    if consensus:
+                        for label, count in consensus.result().items():
+                            if count is not None:
+                                row[label] = digit_helper.vote_count_text(count)
+                    for v in row.values(): print(v, end=' - ')
+                    print()
+                    found_rows.append(row)
+                    current_time = coarse_match_time + best[0] * fine_grained_frame_interval + skip_seconds_on_match
+                    if checkpoint:
+                        checkpoint.save(round(current_time, 2), found_rows, one_coarse_match_found)
+                else:
+                    if debug and not fine_matches:
+                        print("No fine-grained matches found within threshold.")
+                    current_time = coarse_match_time + search_duration  # move past fine search window
+                if keyframes_only:
+                    # Back on the keyframe pipe's 13 s sample grid, so the next coarse seek reads on instead of restarting
+                    current_time = session.next_frame_time(current_time)
+                if end_of_stream:
+                    raise stream_ended(session)
+
+            # Break loop after 90 minutes if no coarse match found
+            if not one_coarse_match_found and current_time >= 5400:
+                if debug:
+                    print("Reached 90-minute no-match time limit. Exiting.")
+                raise EOFError
+            
+            # Break loop if after vod_duration (catch skipping past vod end)
+            if current_time >= vod_duration:
+                if debug:
+                    print("Reached or passed end of VOD. Exiting.")
+                raise EOFError
+
+            # Break loop after 12 hours
+            if current_time >= 43200:
+                if debug:
+                    print("Reached 12hr time limit. Exiting.")
+                raise EOFError
+
+            # Print every 5 minutes in hours:minutes format
+            current_time = round(current_time, 2)
+            if checkpoint:
+                checkpoint.maybe_save(current_time, found_rows, one_coarse_match_found)
+            if debug and current_time % 300 < default_frame_interval:
+                real_current_time = time.time()
+                real_elapsed_time = real_current_time - real_time_start
+                real_time_start = real_current_time
+                hours = int(current_time // 3600)
+                minutes = int((current_time % 3600) // 60)
+                print(f"Vod Progress: {hours:02d}:{minutes:02d}\t Step Took: {real_elapsed_time:.2f}s")
+
+    except EOFError:
+        if debug:
+            print("Reached end of stream.")
+        if checkpoint:
+            checkpoint.finished = True
+        if stats:
+            stats.finished = True
+    except Exception as e:
+        print(f"Error: {e}")
+    finally:
+        if debug:
+            print(f"FFmpeg started {ffmpeg_starts + session.restarts} time(s) for this VOD.")
+        if stats:
+            stats.ffmpeg_starts += ffmpeg_starts + session.restarts
+            stats.frames_decoded += frames_decoded + session.frames_decoded
+        session.close()
     
     return found_rows
@@ -0,0 +1,143 @@
+import multiprocessing
+import queue
+import numpy as np
+
+# One EasyOCR model per process, loaded on first use and reused for every VOD
+# easyocr (and torch with it) is imported here too, so processes that only talk to an OcrService never load it
+_reader = None
+
+def get_reader():
+    global _reader
+    if _reader is None:
+        import easyocr
+        _reader = easyocr.Reader(['en'])
+    return _reader
+
+# Runs OCR on a list of preprocessed grayscale crops, returns the text of each ('' if none)
+# reader can be an easyocr.Reader or an OcrClient of a shared OcrService
+# By default the crops are recognized in one batched call with no text detection, since the region boxes are already known
+# detect=True runs full readtext (detection + recognition) on each crop and keeps its first text line
+def read_crops(reader, crops, detect=False):
+    if not crops:
+        return [] # both fast paths answered, no round trip to the OcrService
+    if isinstance(reader, OcrClient):
+        return reader.read_crops(crops)
+    if detect:
+        texts = []
+        for crop in crops:
+            result = reader.readtext(crop, detail=0, paragraph=False)
+            texts.append(result[0].strip() if result else '') # type: ignore
+        return texts
+    return recognize_crops(reader, crops)
+
+# Recognition only, all crops in one reader.recognize() call
+# Crops are stacked top to bottom on one canvas, each one is its own box in horizontal_list
+def recognize_crops(reader, crops):
+    width = max(crop.shape[1] for crop in crops)
+    height = sum(crop.shape[0] for crop in crops)
+    canvas = np.zeros((height, width), dtype=np.uint8)
+    boxes = []
+    y = 0
+    for crop in crops:
+        h, w = crop.shape[:2]
+        canvas[y:y + h, :w] = crop
+        boxes.append([0, w, y, y + h]) # x_min, x_max, y_min, y_max
+        y += h
+
+    results = reader.recognize(canvas, horizontal_list=boxes, free_list=[], detail=1, paragraph=False, batch_size=len(crops))
+
+    # Results come back sorted by box top, match them to crops by y_min
+    box_index = {box[2]: i for i, box in enumerate(boxes)}
+    texts = [''] * len(crops)
+    for points, text, confidence in results:
+        i = box_index.get(int(points[0][1]))
+        if i is not None:
+            texts[i] = text.strip()
+    return texts
+
+# Sidecar OCR process, owns the only EasyOCR model of an app.py run
+# Scraper processes submit crops over a queue through an OcrClient, and the service reads
+# everything that is waiting in one go, so requests from many VODs are batched together
+class OcrService:
+    def __init__(self, num_clients, max_batch_requests=32):
+        self.manager = multiprocessing.Manager()
+        self.requests = self.manager.Queue()
+        self.replies = [self.manager.Queue() for _ in range(num_clients)]
+        # Client ids not handed out yet, each worker process takes one for its lifetime
+        self.free_clients = self.manager.Queue()
+        for client_id in range(num_clients):
+            self.free_clients.put(client_id)
+        self.process = multiprocessing.Process(target=serve, args=(self.requests, self.replies, max_batch_requests), daemon=True)
+
+    # Arguments for OcrClient.from_service, picklable so they can go to worker process initializers
+    def client_args(self):
+        return self.requests, self.replies, self.free_clients
+
+    def start(self):
+        self.process.start()
+        return self
+
+    def stop(self):
+        self.requests.put(None)
+        self.process.join(timeout=60)
+        self.manager.shutdown()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+# Service loop, run in the OcrService process
+def serve(requests, replies, max_batch_requests):
+    reader = get_reader()
+    while True:
+        pending = [requests.get()]
+        while len(pending) < max_batch_requests:
+            try:
+                pending.append(requests.get_nowait())
+            except queue.Empty:
+                break
+
+        stop = None in pending
+        pending = [r for r in pending if r is not None]
+        crops = [crop for _, _, request_crops in pending for crop in request_crops]
+        try:
+            texts = read_crops(reader, crops)
+        except Exception as e:
+            print(f"OCR service error: {e}")
+            texts = [''] * len(crops)
+
+        # Hand each client back its share of the batch
+        start = 0
+        for client_id, request_id, request_crops in pending:
+            replies[client_id].put((request_id, texts[start:start + len(request_crops)]))
+            start += len(request_crops)
+        if stop:
+            break
+
+# Handle to an OcrService from a scraper process
+class OcrClient:
+    def __init__(self, requests, reply_queue, client_id, timeout=600):
+        self.requests = requests
+        self.reply_queue = reply_queue
+        self.client_id = client_id
+        self.timeout = timeout
+        self.next_request_id = 0
+
+    @classmethod
+    def from_service(cls, requests, replies, free_clients):
+        client_id = free_clients.get()
+        return cls(requests, replies[client_id], client_id)
+
+    def read_crops(self, crops):
+        request_id = self.next_request_id
+        self.next_request_id += 1
+        self.requests.put((self.client_id, request_id, list(crops)))
+        try:
+            reply_id, texts = self.reply_queue.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError(f"OCR service did not answer within {self.timeout}s")
+        if reply_id != request_id:
+            raise RuntimeError("OCR service replied out of order")
+        return texts
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import img_helper as img_helper
+
+# Stream url (m3u8) and duration of each VOD, resolved ahead of its scan so FFmpeg starts as soon as a worker is free
+# streamlink (for the m3u8 url) and ffprobe (for the duration, only when Helix gave none) run in threads
+# for the next few VODs while the current ones are scanning
+# stream_cache.json keeps resolved urls until they expire, so a retried VOD is not resolved again,
+# durations never expire, a failed ffprobe (duration inf) is remembered as long as the url
+
+stream_cache_path = 'stream_cache.json'
+stream_url_ttl = 6 * 3600 # seconds a resolved m3u8 url is reused before streamlink runs again
+
+class StreamCache:
+    def __init__(self, path=stream_cache_path, ttl=stream_url_ttl):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {} # url: {'m3u8_url', 'resolved_at', 'duration'}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable stream cache {self.path}: {e}")
+
+    # Cached m3u8 url of a VOD, None if missing or expired
+    def m3u8_url(self, url):
+        with self.lock:
+            entry = self.entries.get(url)
+        if entry and entry.get('m3u8_url') and time.time() - entry.get('resolved_at', 0) < self.ttl:
+            return entry['m3u8_url']
+        return None
+
+    # Cached duration of a VOD, None if unknown, inf while a failed ffprobe on its unexpired url is remembered
+    def duration(self, url):
+        with self.lock:
+            entry = self.entries.get(url)
+        if not entry:
+            return None
+        if entry.get('duration') == float('inf') and time.time() - entry.get('resolved_at', 0) >= self.ttl:
+            return None
+        return entry.get('duration')
+
+    # A url already cached keeps its resolve time, so storing a duration for it does not extend its life
+    def put(self, url, m3u8_url, duration):
+        with self.lock:
+            entry = self.entries.get(url)
+            resolved_at = entry['resolved_at'] if entry and entry.get('m3u8_url') == m3u8_url else time.time()
+            self.entries[url] = {'m3u8_url': m3u8_url, 'resolved_at': resolved_at, 'duration': duration}
+            self._prune()
+            self.save()
+
+    # Expired urls without a known duration are of no further use
+    def _prune(self):
+        now = time.time()
+        for url in [u for u, e in self.entries.items() if e.get('duration') in (None, float('inf')) and now - e.get('resolved_at', 0) >= self.ttl]:
+            del self.entries[url]
+
+    # Written to a temporary file first, like the checkpoints, called with the lock held
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+# (m3u8_url, duration) of a (user_name, url, created_at, duration) VOD, m3u8_url None if streamlink failed
+# duration is Helix's when known, then the cache's, and only then ffprobe's
+# A failed ffprobe gives inf, which process_frames takes as unknown without running ffprobe again
+def resolve(vod, cache=None):
+    user_name, url, created_at, duration = vod
+    if duration is None and cache:
+        duration = cache.duration(url)
+    cached_url = cache.m3u8_url(url) if cache else None
+    m3u8_url = cached_url or img_helper.get_m3u8_url(url)
+    if not m3u8_url:
+        return None, duration
+    probed = duration is None
+    if probed:
+        duration = img_helper.get_vod_duration(m3u8_url)
+    if cache and (probed or not cached_url):
+        cache.put(url, m3u8_url, duration)
+    return m3u8_url, duration
+
+# Yields (vod, (m3u8_url, duration)) for each VOD in order, with the next depth VODs resolving in the background
+# Resolving only a few ahead keeps urls fresh for VODs that wait long for their scan
+def prefetch(vods, cache=None, depth=2):
+    vods = iter(vods)
+    with ThreadPoolExecutor(max_workers=max(1, depth)) as executor:
+        pending = deque()
+        for vod in vods:
+            pending.append((vod, executor.submit(resolve, vod, cache)))
+            if len(pending) > depth:
+                vod, future = pending.popleft()
+                yield vod, future.result()
+        while pending:
+            vod, future = pending.popleft()
+            yield vod, future.result()
@@ -0,0 +1,121 @@
+import os
+import re
+import csv
+import sys
+import hashlib
+import cv2
+import numpy as np
+
+import hash_helper as hash_helper
+
+# Map names by image hash lookup, the mapN regions only ever show one of the 29 rendered titles in clean.overwatch_maps
+# Reference hashes live in map_title_index.csv (map_name, hash), built once from labeled crops with:
+#   python src/title_helper.py templates_maps
+# where templates_maps/<map slug>/*.png are title crops, collected while scraping with --collect-map-crops
+
+map_index_path = 'map_title_index.csv'
+map_templates_dir = 'templates_maps'
+title_hash_size = 16 # 256 bit pHash, titles differ in small details
+
+# Folder safe name for a map ("WATCHPOINT: GIBRALTAR" -> "WATCHPOINT_GIBRALTAR")
+def map_slug(map_name):
+    return re.sub(r'[^A-Z0-9]+', '_', map_name.upper()).strip('_')
+
+# 256 bit pHash of each title crop, crops are stretched to the square pHash input first so the text fills it
+# The blur keeps hashes stable when the text lands a pixel or two off between stream resolutions
+def hash_titles(crops):
+    if not crops:
+        return np.zeros((0, title_hash_size * title_hash_size // 64), dtype=np.uint64)
+    img_size = title_hash_size * 4
+    stack = np.stack([cv2.resize(cv2.GaussianBlur(crop, (0, 0), 1.5), (img_size, img_size), interpolation=cv2.INTER_AREA)
+                      for crop in crops])
+    return hash_helper.phash_stack(stack, hash_size=title_hash_size)
+
+class MapTitleIndex:
+    # A crop is named when its nearest reference is within max_distance bits,
+    # and every reference of another map is at least min_margin bits further away
+    def __init__(self, names=(), hashes=None, max_distance=72, min_margin=12):
+        self.names = list(names)
+        self.hashes = hashes if hashes is not None else np.zeros((0, title_hash_size * title_hash_size // 64), dtype=np.uint64)
+        self.max_distance = max_distance
+        self.min_margin = min_margin
+
+    @classmethod
+    def load(cls, path=map_index_path, **kwargs):
+        names = []
+        hashes = []
+        if os.path.exists(path):
+            with open(path, newline='', encoding='utf-8') as csvfile:
+                for row in csv.DictReader(csvfile):
+                    names.append(row['map_name'])
+                    hashes.append(np.frombuffer(bytes.fromhex(row['hash']), dtype='>u8').astype(np.uint64))
+        return cls(names, np.stack(hashes) if hashes else None, **kwargs)
+
+    def save(self, path=map_index_path):
+        with open(path, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=['map_name', 'hash'])
+            writer.writeheader()
+            for name, title_hash in zip(self.names, self.hashes):
+                writer.writerow({'map_name': name, 'hash': title_hash.astype('>u8').tobytes().hex()})
+
+    def add(self, crops, names):
+        self.hashes = np.concatenate([self.hashes, hash_titles(list(crops))])
+        self.names.extend(names)
+
+    # Map name for each raw grayscale title crop, None where there is no confident match
+    def lookup(self, crops):
+        if not self.names or not crops:
+            return [None] * len(crops)
+        distances = hash_helper.hamming_distances(hash_titles(list(crops)), self.hashes)
+        names = np.array(self.names)
+        found = []
+        for crop_distances in distances:
+            best = int(np.argmin(crop_distances))
+            others = crop_distances[names != names[best]]
+            runner_up = others.min() if len(others) else np.iinfo(np.int64).max
+            if crop_distances[best] <= self.max_distance and runner_up - crop_distances[best] >= self.min_margin:
+                found.append(self.names[best])
+            else:
+                found.append(None)
+        return found
+
+_index = None
+
+# Index from map_title_index.csv, loaded once per process
+def get_index():
+    global _index
+    if _index is None:
+        _index = MapTitleIndex.load(map_index_path)
+    return _index
+
+# Saves a raw title crop under folder/<map slug>/, named by content so duplicates collapse
+def save_labeled_crop(crop, map_name, folder=map_templates_dir):
+    label_dir = os.path.join(folder, map_slug(map_name))
+    os.makedirs(label_dir, exist_ok=True)
+    name = hashlib.sha1(np.ascontiguousarray(crop).tobytes()).hexdigest()[:16]
+    cv2.imwrite(os.path.join(label_dir, f"{name}.png"), crop)
+
+# Builds an index from folder/<map slug>/*.png, slugs are matched back to the names in valid_maps
+def build_index(folder, valid_maps):
+    names_by_slug = {map_slug(name): name for name in valid_maps}
+    index = MapTitleIndex()
+    for slug in sorted(os.listdir(folder)):
+        label_dir = os.path.join(folder, slug)
+        if slug not in names_by_slug or not os.path.isdir(label_dir):
+            continue
+        crops = []
+        for fname in sorted(os.listdir(label_dir)):
+            crop = cv2.imread(os.path.join(label_dir, fname), cv2.IMREAD_GRAYSCALE)
+            if crop is None:
+                print(f"Failed to load map template {slug}/{fname}")
+                continue
+            crops.append(crop)
+        index.add(crops, [names_by_slug[slug]] * len(crops))
+    return index
+
+if __name__ == "__main__":
+    import clean as clean
+    folder = sys.argv[1] if len(sys.argv) > 1 else map_templates_dir
+    index = build_index(folder, clean.overwatch_maps)
+    index.save(map_index_path)
+    print(f"Saved {len(index.names)} title hashes for {len(set(index.names))} maps to {map_index_path}")
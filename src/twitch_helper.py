@@ -1,32 +1,91 @@
 import os
 from dotenv import load_dotenv
 import requests
-import json
+from requests.adapters import HTTPAdapter
+import asyncio
 from datetime import datetime
 import time
+import threading
 import csv
+import re
 
-load_dotenv()
+overwatch2_twitch_id = '515025'
+# Overridable so the client can run against a local mock Helix server, benchmarks/mock_helix.py
+helix_base_url = os.getenv('TWITCH_HELIX_URL', 'https://api.twitch.tv/helix')
+oauth_token_url = os.getenv('TWITCH_OAUTH_URL', 'https://id.twitch.tv/oauth2/token')
 
-client_id = os.getenv('TWITCH_CLIENT_ID')
-client_secret = os.getenv('TWITCH_SECRET')
-if not all([client_id, client_secret]):
-    raise ValueError("Missing Twitch API Keys")
+# App access token, fetched on first use and cached until refresh_margin seconds before it expires
+# The API keys are read (from the environment or .env) only when a token is first needed,
+# so importing this module never touches the network or fails on missing keys
+class TokenProvider:
+    def __init__(self, client_id=None, client_secret=None, token_url=None, refresh_margin=300):
+        self._client_id = client_id
+        self._client_secret = client_secret
+        self.token_url = token_url or oauth_token_url
+        self.refresh_margin = refresh_margin
+        self._token = None
+        self.expires_at = 0.0
+        self.lock = threading.Lock()
 
-overwatch2_twitch_id = '515025'
+    def _load_keys(self):
+        if not all([self._client_id, self._client_secret]):
+            load_dotenv()
+            self._client_id = self._client_id or os.getenv('TWITCH_CLIENT_ID')
+            self._client_secret = self._client_secret or os.getenv('TWITCH_SECRET')
+        if not all([self._client_id, self._client_secret]):
+            raise ValueError("Missing Twitch API Keys")
+
+    @property
+    def client_id(self):
+        self._load_keys()
+        return self._client_id
+
+    # Cached token, fetched again once it is about to expire
+    def token(self):
+        with self.lock:
+            if self._token is None or time.time() >= self.expires_at - self.refresh_margin:
+                self._load_keys()
+                params = {
+                    "client_id": self._client_id,
+                    "client_secret": self._client_secret,
+                    "grant_type": "client_credentials"
+                }
+                response = requests.post(self.token_url, params=params, timeout=30)
+                response.raise_for_status()
+                j = response.json()
+                self._token = j["access_token"]
+                self.expires_at = time.time() + float(j.get("expires_in", 3600))
+            return self._token
+
+    # Drops the cached token after Helix rejected it (401), unless another request already replaced it
+    def invalidate(self, token=None):
+        with self.lock:
+            if token is None or token == self._token:
+                self._token = None
+
+# One provider per process, created on first use
+_token_provider = None
+
+def get_token_provider():
+    global _token_provider
+    if _token_provider is None:
+        _token_provider = TokenProvider()
+    return _token_provider
 
 def get_oauth_token():
-    url = "https://id.twitch.tv/oauth2/token"
-    params = {
-        "client_id": client_id,
-        "client_secret": client_secret,
-        "grant_type": "client_credentials"
-    }
-    response = requests.post(url, params=params)
-    oauth_token = response.json()["access_token"]
-    return oauth_token
-    
-oauth_token = get_oauth_token()
+    return get_token_provider().token()
+
+# Seconds in a Helix duration like "3h2m1s", None if it does not parse
+def parse_duration(text):
+    match = re.fullmatch(r'(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s)?', text or '')
+    if not text or not match:
+        return None
+    hours, minutes, seconds = (int(g) if g else 0 for g in match.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+# (user_name, url, created_at, duration) of a Helix video, duration in seconds so the scan needs no ffprobe
+def vod_tuple(v):
+    return (v['user_name'], v['url'], v['created_at'], parse_duration(v.get('duration')))
 
 # Whitelist of overwatch streamers to get vods from
 # High rank (GM or so), mostly comp overwatch (no stadium/variety), no sub-only vods, english (for OCR), no obstructive overlay
@@ -38,100 +97,184 @@ whitelist_streamers = [
     'romani_ow', 'Gurkmeister', 'scyle2', 'Bowie', 'NenWhy', 'kronikfps'
 ]
 
-def get_user_id(username):
-    r = requests.get(f"https://api.twitch.tv/helix/users?login={username}", 
-                     headers={f"Client-ID":client_id, f"Authorization":f"Bearer {oauth_token}"})
-    r.raise_for_status()
-    j = json.loads(r.text)
-    id = j['data'][0]['id']
-    return id
+# Token bucket for Helix's rate limit, points_per_minute is the app token default
+# Every response resyncs it from the Ratelimit-Limit, Ratelimit-Remaining and Ratelimit-Reset headers,
+# so requests slow down as the bucket runs dry instead of running into 429s
+class RateLimiter:
+    def __init__(self, points_per_minute=800):
+        self.capacity = points_per_minute
+        self.tokens = float(points_per_minute)
+        self.updated = time.monotonic()
+        self.reset_at = 0.0 # epoch seconds when an emptied bucket is refilled
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1 and time.time() >= self.reset_at:
+                    self.tokens -= 1
+                    return
+                wait = max((1 - self.tokens) * 60 / self.capacity, self.reset_at - time.time(), 0.01)
+                await asyncio.sleep(wait)
+
+    def update(self, headers):
+        self._refill()
+        if headers.get('Ratelimit-Limit'):
+            self.capacity = int(headers['Ratelimit-Limit'])
+        if headers.get('Ratelimit-Remaining') is not None:
+            self.tokens = min(self.tokens, float(headers['Ratelimit-Remaining']))
+            if self.tokens < 1 and headers.get('Ratelimit-Reset'):
+                self.reset_at = float(headers['Ratelimit-Reset'])
+
+# Helix API client, one keep-alive connection pool shared by up to max_concurrency requests at a time
+# Requests run in threads (requests is blocking), coordinated by asyncio so many streamers are fetched at once
+class HelixClient:
+    def __init__(self, token_provider, base_url=None, max_concurrency=8, timeout=30, max_retries=3):
+        self.token_provider = token_provider
+        self.base_url = (base_url or helix_base_url).rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.session = requests.Session()
+        self.session.mount(self.base_url, HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency))
+        self.limiter = RateLimiter()
+        self._semaphore = None
+
+    # Blocking GET with the current token, run in a thread so a token refresh never stalls the event loop
+    def _get(self, url, params):
+        token = self.token_provider.token()
+        headers = {"Client-ID": self.token_provider.client_id, "Authorization": f"Bearer {token}"}
+        return token, self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+
+    # JSON body of GET base_url/path, retried on 429 (after the rate limit reset) and on 5xx
+    # A 401 means the token expired or was revoked early, it is refreshed and the request sent once more
+    async def get(self, path, params):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        refreshed = False
+        attempt = 0
+        while True:
+            await self.limiter.acquire()
+            async with self._semaphore:
+                token, r = await asyncio.to_thread(self._get, f"{self.base_url}/{path}", params)
+            self.limiter.update(r.headers)
+            if r.status_code == 401 and not refreshed:
+                self.token_provider.invalidate(token)
+                refreshed = True
+                continue
+            if (r.status_code == 429 or r.status_code >= 500) and attempt < self.max_retries:
+                reset_in = float(r.headers.get('Ratelimit-Reset', time.time() + 1)) - time.time()
+                await asyncio.sleep(max(reset_in, 2 ** attempt) if r.status_code == 429 else 2 ** attempt)
+                attempt += 1
+                continue
+            r.raise_for_status()
+            return r.json()
 
+    # Yields each page's data, following pagination cursors until there are none left, max_pages is reached,
+    # or stop(page_data) returns True
+    async def pages(self, path, params, max_pages=None, stop=None):
+        params = dict(params)
+        pages_fetched = 0
+        while True:
+            j = await self.get(path, params)
+            data = j.get('data', [])
+            yield data
+            pages_fetched += 1
+            cursor = j.get('pagination', {}).get('cursor')
+            if not data or not cursor or (max_pages and pages_fetched >= max_pages) or (stop and stop(data)):
+                return
+            params['after'] = cursor
 
-# Returns list of (user_name, url, created_at) from the last 10 vods of user_id
+    async def user_id(self, username):
+        j = await self.get('users', {'login': username})
+        return j['data'][0]['id']
+
+    # Archive VODs of user_id created between cutoff_start_date and cutoff_end_date, newest first
+    # Pages are followed until a page reaches past cutoff_start_date, Helix lists a user's videos newest first
+    async def user_vods(self, user_id, cutoff_start_date, cutoff_end_date):
+        def created(v):
+            return datetime.fromisoformat(v['created_at'].replace('Z', '+00:00'))
+        vods = []
+        async for data in self.pages('videos', {'user_id': user_id, 'type': 'archive', 'first': 100},
+                                     stop=lambda data: created(data[-1]) < cutoff_start_date):
+            vods.extend(v for v in data if cutoff_start_date <= created(v) <= cutoff_end_date)
+        return vods
+
+    # user_vods of every user id at once, in the order of user_ids
+    async def whitelist_vods(self, user_ids, cutoff_start_date, cutoff_end_date):
+        return await asyncio.gather(*[self.user_vods(user_id, cutoff_start_date, cutoff_end_date) for user_id in user_ids])
+
+    def close(self):
+        self.session.close()
+
+def helix_client(token_provider=None, **kwargs):
+    return HelixClient(token_provider or get_token_provider(), **kwargs)
+
+# Runs fn(client) with a fresh client, for the synchronous helpers below
+def run_with_client(fn, **kwargs):
+    async def run():
+        client = helix_client(**kwargs)
+        try:
+            return await fn(client)
+        finally:
+            client.close()
+    return asyncio.run(run())
+
+def get_user_id(username):
+    return run_with_client(lambda client: client.user_id(username))
+
+# Returns list of (user_name, url, created_at, duration) from the last 10 vods of user_id
 def vod_info_from_id(user_id):
-    r = requests.get(f"https://api.twitch.tv/helix/videos?user_id={user_id}&type=archive&first=10", 
-                     headers={f"Client-ID":client_id, f"Authorization":f"Bearer {oauth_token}"})
-    r.raise_for_status()
-    j = json.loads(r.text)
-    
-    print(j['data'][0])
-    
-    return [(v['user_name'], v['url'], v['created_at']) for v in j['data']]
+    j = run_with_client(lambda client: client.get('videos', {'user_id': user_id, 'type': 'archive', 'first': 10}))
+    return [vod_tuple(v) for v in j['data']]
 
 # Gets VOD info from random streams at least an hour in length, and in english (for OCR)
 # Randomness from getting the most recent 1h+ vods on the site, viewership independent
 # Returns VOD info in full for now
 def get_random_overwatch_vods():
-    all_filtered = []
-    cursor = None
-    pages_fetched = 0
     max_pages = 5
     target_number_of_vods = 50 # At least this many vods should be grabbed
 
-    while pages_fetched < max_pages:
-        url = f"https://api.twitch.tv/helix/videos?game_id={overwatch2_twitch_id}&type=archive&first=100"
-        if cursor:
-            url += f"&after={cursor}"
-
-        r = requests.get(url, headers={"Client-ID": client_id, "Authorization": f"Bearer {oauth_token}"})
-        r.raise_for_status()
-        data = r.json()['data']
-
-        #filtered = [v for v in data if v['created_at'] < one_hour_ago_iso]
-        filtered = [v for v in data if 'h' in v['duration'] and 'en' in v['language']] # at least an hour long, in english
-        all_filtered.extend(filtered)
-
-        if not data:
-            if len(all_filtered) > 0:
+    async def fetch(client):
+        all_filtered = []
+        params = {'game_id': overwatch2_twitch_id, 'type': 'archive', 'first': 100}
+        async for data in client.pages('videos', params, max_pages=max_pages,
+                                       stop=lambda data: len(all_filtered) >= target_number_of_vods):
+            if not data and all_filtered:
                 print("Error in getting random twitch vods, no data")
-            break
-        
-        if len(all_filtered) >= target_number_of_vods:
-            break
-
-        cursor = r.json().get('pagination', {}).get('cursor')
-        if not cursor:
-            if len(all_filtered) > 0:
-                print("Error in getting random twitch vods, no cursor")
-            break
+            filtered = [v for v in data if (parse_duration(v['duration']) or 0) >= 3600 and 'en' in v['language']] # at least an hour long, in english
+            all_filtered.extend(filtered)
+        return all_filtered
 
-        pages_fetched += 1
-        time.sleep(0.25)
+    return run_with_client(fetch)
 
-    return all_filtered
-
-# Returns list of (user_name, url, created_at) from the last 20 vods of all user_id in (username, user_id) csv input between date range
+# Returns list of (user_name, url, created_at, duration) of every vod between the cutoff dates, of all user_id in (username, user_id) csv input
 def get_whitelist_overwatch_vods(csv_path, cutoff_start_date, cutoff_end_date):
-    vods = []
-    
     with open(csv_path, newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            user_id = row['user_id']
-            r = requests.get(f"https://api.twitch.tv/helix/videos?user_id={user_id}&type=archive&first=20", 
-                                headers={f"Client-ID":client_id, f"Authorization":f"Bearer {oauth_token}"})
-            r.raise_for_status()
-            for v in r.json()['data']:
-                dt = datetime.fromisoformat(v['created_at'].replace('Z', '+00:00'))
-                if cutoff_start_date <= dt <= cutoff_end_date:
-                    vods.append((v['user_name'], v['url'], v['created_at']))
-            time.sleep(0.25)
+        user_ids = [row['user_id'] for row in csv.DictReader(csvfile)]
 
-    return vods
+    per_user = run_with_client(lambda client: client.whitelist_vods(user_ids, cutoff_start_date, cutoff_end_date))
+    return [vod_tuple(v) for vods in per_user for v in vods]
 
 # Getting user IDs for whitelisted streamers
 if __name__ == "__main__":
-    results = []
-    for username in whitelist_streamers:
-        try:
-            user_id = get_user_id(username)
-            if user_id:
-                results.append({'username': username, 'user_id': user_id})
-            time.sleep(0.5)  # optional, to avoid rate limits
-        except Exception as e:
-            print(f"Error fetching {username}: {e}")
+    async def fetch_ids(client):
+        async def fetch(username):
+            try:
+                return {'username': username, 'user_id': await client.user_id(username)}
+            except Exception as e:
+                print(f"Error fetching {username}: {e}")
+        return [r for r in await asyncio.gather(*[fetch(username) for username in whitelist_streamers]) if r]
+
+    results = run_with_client(fetch_ids)
 
     with open('whitelist.csv', 'w', newline='') as f:
         writer = csv.DictWriter(f, fieldnames=['username', 'user_id'])
         writer.writeheader()
-        writer.writerows(results)
\ No newline at end of file
+        writer.writerows(results)
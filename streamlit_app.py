@@ -1,16 +1,43 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 
 import src.clean as clean
 
-# Load the cleaned data
+cleaned_csv_path = 'vote_data_whitelisted_cleaned.csv'
+summary_folder = clean.summary_dir(cleaned_csv_path)
+
+# Load the dashboard artifacts written by clean.py, cached per artifact content hash so new data is picked up
+# Falls back to summarizing the cleaned csv if the artifacts are missing or from another version
+@st.cache_data
+def load_summary(folder, content_hash):
+    artifacts = clean.read_summary_artifacts(folder)
+    if artifacts is None:
+        artifacts = clean.summary_artifacts(pd.read_csv(cleaned_csv_path))
+    artifacts['cube']['created_at'] = pd.to_datetime(artifacts['cube']['created_at']).dt.date
+    return artifacts
+
+# Map summary of the cube slice matching the sidebar filters, an empty streamers or map_types means all of them
+@st.cache_data
+def filtered_summary(content_hash, start_date, end_date, streamers, map_types):
+    cube = load_summary(summary_folder, content_hash)['cube']
+    mask = (cube['created_at'] >= start_date) & (cube['created_at'] <= end_date)
+    if streamers:
+        mask &= cube['user_name'].isin(streamers)
+    if map_types:
+        mask &= cube['Map Type'].isin(map_types)
+    return clean.summarize_cube(cube[mask])
+
+# Full cleaned rows, only loaded for the raw data table
 @st.cache_data
-def load_and_summarize():
-    df = pd.read_csv('vote_data_whitelisted_cleaned.csv')
-    return df, clean.summarize_vote_data(df)
+def load_cleaned(content_hash):
+    return pd.read_csv(cleaned_csv_path)
 
-df_wl, df_maps = load_and_summarize()
+summary_hash = clean.summary_hash(summary_folder)
+artifacts = load_summary(summary_folder, summary_hash)
+cube = artifacts['cube']
+total_events = int(artifacts['total_votes']['Events'].sum())
 
 st.set_page_config(layout="wide", page_title="Overwatch Map Voting Data", page_icon="favicon.png")
 
@@ -34,6 +61,24 @@ st.sidebar.markdown("""
 [Methodology](#methodology)
 """)
 
+# Filters, applied to the tier list, bar charts, scatter plot and map data
+st.sidebar.title("Filters")
+first_date, last_date = cube['created_at'].min(), cube['created_at'].max()
+date_range = st.sidebar.date_input("Date range", value=(first_date, last_date), min_value=first_date, max_value=last_date)
+streamers = st.sidebar.multiselect("Streamers", sorted(cube['user_name'].unique()), placeholder="All streamers")
+map_types = st.sidebar.multiselect("Map types", sorted(cube['Map Type'].unique()), placeholder="All map types")
+start_date, end_date = (date_range[0], date_range[-1]) if date_range else (first_date, last_date)
+filtered = (start_date, end_date) != (first_date, last_date) or streamers or map_types
+
+if filtered:
+    df_maps = filtered_summary(summary_hash, start_date, end_date, tuple(streamers), tuple(map_types))
+else:
+    df_maps = artifacts['map_summary']
+
+# df_maps sorted by each charted column, highest first
+maps_sorted = {column: df_maps.sort_values(column, ascending=False)
+               for column in ["Votes_per_Appearance", "Percent_per_Appearance", "Total_Votes", "Win_Percentage"]}
+
 left, center, right = st.columns([1, 5, 1])
 with center:
 
@@ -41,6 +86,12 @@ with center:
     st.title("Overwatch Map Voting Data")
     st.write("Data on Map Voting in Grandmaster, NA + EMEA Lobbies, extracted from public Twitch VODs.")
     st.write("Updated as of 2025-07-22.")
+    if filtered:
+        st.info(f"Filtered to {start_date} - {end_date}"
+                f"{', ' + ', '.join(streamers) if streamers else ''}{', ' + ', '.join(map_types) + ' maps' if map_types else ''}.")
+    if df_maps.empty:
+        st.warning("No map vote events match these filters.")
+        st.stop()
 
     # --- TIER LIST ---
     map_image_filenames = {
@@ -80,7 +131,7 @@ with center:
     st.subheader("Map Tier List (based on Votes per Appearance)")
     tiers = ["S", "A", "B", "C", "D", "F"]
     for tier in tiers:
-        tier_maps = df_maps[df_maps["Tier"] == tier].sort_values("Votes_per_Appearance", ascending=False)
+        tier_maps = maps_sorted["Votes_per_Appearance"][maps_sorted["Votes_per_Appearance"]["Tier"] == tier]
         rows = [tier_maps.iloc[i:i + columns_per_row] for i in range(0, len(tier_maps), columns_per_row)]
         for row_index, row_df in enumerate(rows):
             cols = st.columns(columns_per_row + 1)  # +1 for the tier label column
@@ -109,7 +160,7 @@ with center:
     }
     st.subheader("Bar Charts")
     fig_votes_per_appearance = px.bar(
-        df_maps.sort_values("Votes_per_Appearance", ascending=False),
+        maps_sorted["Votes_per_Appearance"],
         x="Map Name",
         y="Votes_per_Appearance",
         color="Map Type",
@@ -117,11 +168,11 @@ with center:
         title="Votes per Appearance per Map",
         labels={"Votes_per_Appearance": "Votes per Appearance", "Map Name": "Map"},
         height=500,
-        category_orders={"Map Name": df_maps.sort_values("Votes_per_Appearance", ascending=False)["Map Name"].tolist()}
+        category_orders={"Map Name": maps_sorted["Votes_per_Appearance"]["Map Name"].tolist()}
     )
     st.plotly_chart(fig_votes_per_appearance, use_container_width=True)
     fig_percent_per_appearance = px.bar(
-        df_maps.sort_values("Percent_per_Appearance", ascending=False),
+        maps_sorted["Percent_per_Appearance"],
         x="Map Name",
         y="Percent_per_Appearance",
         color="Map Type",
@@ -129,11 +180,11 @@ with center:
         title="Percent of Votes per Appearance per Map",
         labels={"Percent_per_Appearance": "% of Votes per Appearance", "Map Name": "Map"},
         height=500,
-        category_orders={"Map Name": df_maps.sort_values("Percent_per_Appearance", ascending=False)["Map Name"].tolist()}
+        category_orders={"Map Name": maps_sorted["Percent_per_Appearance"]["Map Name"].tolist()}
     )
     st.plotly_chart(fig_percent_per_appearance, use_container_width=True)
     fig_votes = px.bar(
-        df_maps.sort_values("Total_Votes", ascending=False),
+        maps_sorted["Total_Votes"],
         x="Map Name",
         y="Total_Votes",
         color="Map Type",
@@ -141,7 +192,7 @@ with center:
         title="Total Votes per Map",
         labels={"Total_Votes": "Total Votes", "Map Name": "Map"},
         height=500,
-        category_orders={"Map Name": df_maps.sort_values("Total_Votes", ascending=False)["Map Name"].tolist()}
+        category_orders={"Map Name": maps_sorted["Total_Votes"]["Map Name"].tolist()}
     )
     st.plotly_chart(fig_votes, use_container_width=True)
     
@@ -159,7 +210,7 @@ with center:
     # st.plotly_chart(fig_percent, use_container_width=True)
 
     fig_win_percentage = px.bar(
-        df_maps.sort_values("Win_Percentage", ascending=False),
+        maps_sorted["Win_Percentage"],
         x="Map Name",
         y="Win_Percentage",
         color="Map Type",
@@ -167,7 +218,7 @@ with center:
         title="Win Percentage (Gets the Majority of Votes) per Map",
         labels={"Win_Percentage": "Win Percentage", "Map Name": "Map"},
         height=500,
-        category_orders={"Map Name": df_maps.sort_values("Win_Percentage", ascending=False)["Map Name"].tolist()}
+        category_orders={"Map Name": maps_sorted["Win_Percentage"]["Map Name"].tolist()}
     )
     st.plotly_chart(fig_win_percentage, use_container_width=True)
     
@@ -183,7 +234,7 @@ with center:
     #     labels={"Votes_per_Appearance": "Votes per Appearance", "Win_Percentage": "Win Percentage"},
     #     hover_data=["Map Name"],
     #     height=500,
-    #     category_orders={"Map Name": df_maps.sort_values("Votes_per_Appearance", ascending=False)["Map Name"].tolist()}
+    #     category_orders={"Map Name": maps_sorted["Votes_per_Appearance"]["Map Name"].tolist()}
     # )
     # fig_winrate_vs_votes.update_traces(marker=dict(size=10))
     # st.plotly_chart(fig_winrate_vs_votes, use_container_width=True)
@@ -197,13 +248,8 @@ with center:
     }
 
     st.subheader("Votes by Card")
-    df_votes_by_card = df_wl[['votes1', 'votes2', 'votes3']].sum().reset_index()
-    df_votes_by_card.columns = ['Card', 'Votes']
-    df_votes_by_card['Card'] = df_votes_by_card['Card'].replace({
-        'votes1': 'Left',
-        'votes2': 'Middle',
-        'votes3': 'Right'
-    })
+    st.caption("Card charts cover every logged event, the sidebar filters don't apply to them.")
+    df_votes_by_card = artifacts['votes_by_card']
     fig_votes_by_card = px.pie(
         df_votes_by_card,
         values='Votes',
@@ -217,18 +263,13 @@ with center:
     st.plotly_chart(fig_votes_by_card, use_container_width=True)
 
     st.subheader("Vote Distribution per Card")
-    df_votes_long = df_wl[['votes1', 'votes2', 'votes3']].rename(columns={
-        'votes1': 'Left',
-        'votes2': 'Middle',
-        'votes3': 'Right'
-    }).melt(var_name='Card', value_name='Votes')
-    fig_votes_hist = px.histogram(
-        df_votes_long,
+    fig_votes_hist = px.bar(
+        artifacts['vote_distribution'],
         x='Votes',
+        y='Events',
         color='Card',
-        nbins=11,
         barmode='group',
-        category_orders={'Votes': list(range(0, 11))},
+        category_orders={'Votes': list(range(0, 11)), 'Card': ['Left', 'Middle', 'Right']},
         labels={'Votes': 'Votes per Event', 'Card': 'Card'},
         title='Distribution of Votes per Card',
         color_discrete_map=card_color_map,
@@ -247,18 +288,21 @@ with center:
     with c1:
         st.subheader("Box Plot")
         st.write("Total Participation per Map Vote Event")
-        st.write(f"Total Number of Map Vote Events Logged: {len(df_wl)}")
+        st.write(f"Total Number of Map Vote Events Logged: {total_events}")
         st.write("""
                 Note that 0 and 1 total vote scenarios have been removed from the dataset, 
                 as they are rare and more often than not come from errors in the data collection process.
                 
                 
-                Also note that vote events where all 10 players voted for the same map are counted as just 9 votes due to 
-                the method of collecting (very few, if any frames on screen show 0, 0, and 10 votes).
+                Also note that vote events where all 10 players voted for the same map are rare in the data,
+                as very few frames on screen show 0, 0, and 10 votes. When one does, it is counted as 10 votes.
                 """)
     with c2:
+        # One point per event, rebuilt from the event counts per total
+        df_total_votes = pd.DataFrame({'total_votes': np.repeat(artifacts['total_votes']['total_votes'].to_numpy(),
+                                                                artifacts['total_votes']['Events'].to_numpy())})
         fig_box_plot = px.box(
-            df_wl,
+            df_total_votes,
             y='total_votes',
             labels={'total_votes': 'Total Votes'},
             height=450,
@@ -281,7 +325,7 @@ with center:
         labels={'Appearances': 'Appearances', 'Total_Votes': 'Total Votes'},
         hover_data=['Map Name'],
         height=500,
-        category_orders={'Map Name': df_maps.sort_values('Total_Votes', ascending=False)['Map Name'].tolist()}
+        category_orders={'Map Name': maps_sorted['Total_Votes']['Map Name'].tolist()}
     )
     fig_appearances_vs_votes.update_traces(marker=dict(size=10))
     st.plotly_chart(fig_appearances_vs_votes, use_container_width=True)
@@ -292,7 +336,8 @@ with center:
 
     # --- RAW DATA ---
     st.subheader("Raw Data")
-    st.dataframe(df_wl)
+    if st.checkbox("Show all cleaned vote events"):
+        st.dataframe(load_cleaned(summary_hash))
 
     # --- METHODOLOGY ---
     st.subheader("Methodology")